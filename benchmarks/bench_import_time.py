@@ -0,0 +1,126 @@
+"""
+Startup-time benchmark: cumulative import time of the package entry points.
+
+Each module is imported in a fresh interpreter with `python -X importtime`,
+`--runs` times. Times are compared as a ratio to the import time of
+REFERENCE_MODULE measured in the same run, so the committed baseline holds
+on other machines. The run also fails when importing any of them loads a
+third-party package missing from the baseline, or one of the heavy optional
+stacks (OpenAI clients, ChromaDB, pgvector, Google API discovery) or needs a
+database: imports run with DB_TYPE=pgvector and no DATABASE_URL.
+
+Run from the repository root:
+    python -m benchmarks.bench_import_time [--runs 5] [--tolerance 1.5] [--update-baseline]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "import_time_baseline.json")
+
+# Entry points of the CLI, the workers and the query service
+MODULES = (
+    "youtube_chatbot",
+    "youtube_chatbot.database",
+    "youtube_chatbot.worker",
+    "youtube_chatbot.chatbot",
+    "youtube_chatbot.video_processor",
+    "youtube_chatbot.db_admin",
+)
+# Every entry point needs it, its import time is the unit of the ratios
+REFERENCE_MODULE = "sqlalchemy"
+
+# Modules that must only be imported once the feature using them runs
+DEFERRED_MODULES = ("langchain_openai", "langchain_chroma", "chromadb", "googleapiclient", "pgvector",
+                    "langchain.chains", "youtube_transcript_api")
+
+
+def _run(code):
+    env = dict(os.environ, DB_TYPE="pgvector", PYTHONPATH=os.getcwd())
+    env.pop("DATABASE_URL", None)
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True, env=env, check=True)
+
+
+def import_time_ms(module):
+    """
+    :return: Cumulative import time of `module` in milliseconds, in a fresh interpreter
+    """
+    result = _run(f"import {module}")
+    # Last line is the requested module: "import time: self [us] | cumulative | name"
+    for line in reversed(result.stderr.splitlines()):
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1000
+    raise RuntimeError(f"No importtime entry for {module}")
+
+
+def loaded_packages(module):
+    """
+    :return: (sorted third-party top-level packages, deferred modules) in sys.modules after importing `module`
+    """
+    code = (f"import json, sys, {module}; "
+            f"print(json.dumps([sorted({{name.split('.')[0] for name in sys.modules}}), "
+            f"[m for m in {DEFERRED_MODULES!r} if m in sys.modules]]))")
+    packages, deferred = json.loads(_run(code).stdout)
+    own = module.split(".")[0]
+    return [name for name in packages if name not in sys.stdlib_module_names and name != own
+            and not name.startswith("_")], deferred
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="fail when a ratio exceeds baseline * tolerance")
+    parser.add_argument("--slack", type=float, default=0.5,
+                        help="ratio allowance added to small baselines, absorbs interpreter noise")
+    parser.add_argument("--update-baseline", action="store_true", help=f"write the ratios to {BASELINE_PATH}")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+    baseline_ratios = baseline.get("ratios", {})
+    baseline_packages = baseline.get("packages", {})
+
+    reference_ms = statistics.median(import_time_ms(REFERENCE_MODULE) for _ in range(args.runs))
+    print(f"{REFERENCE_MODULE:<34} {reference_ms:8.1f} ms  (reference)")
+    failures = []
+    ratios, packages = {}, {}
+    for module in MODULES:
+        median_ms = statistics.median(import_time_ms(module) for _ in range(args.runs))
+        ratios[module] = round(median_ms / reference_ms, 2)
+        expected = baseline_ratios.get(module)
+        status = "ok"
+        if expected:
+            limit = max(expected * args.tolerance, expected + args.slack)
+            if ratios[module] > limit:
+                status = f"REGRESSION (limit x{limit:.2f})"
+                failures.append(module)
+        packages[module], deferred = loaded_packages(module)
+        new_packages = sorted(set(packages[module]) - set(baseline_packages.get(module, packages[module])))
+        if new_packages:
+            status += f", new packages {', '.join(new_packages)}"
+            failures.append(module)
+        if deferred:
+            status += f", loads {', '.join(deferred)}"
+            failures.append(module)
+        print(f"{module:<34} {median_ms:8.1f} ms  x{ratios[module]:<6} baseline x{expected or '-':<6} "
+              f"{len(packages[module]):3d} packages  {status}")
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump({'reference': REFERENCE_MODULE, 'ratios': ratios, 'packages': packages}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {BASELINE_PATH}")
+    elif failures:
+        sys.exit(f"Import time check failed for: {', '.join(sorted(set(failures)))}")
+
+
+if __name__ == "__main__":
+    main()
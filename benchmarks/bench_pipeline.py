@@ -0,0 +1,271 @@
+"""
+Offline ingest and query benchmark over the storage backends.
+
+YouTubeTranscriptApi, get_video_details, ChatOpenAI and OpenAIEmbeddings are
+replaced by the deterministic stand-ins of youtube_chatbot.fakes, with
+configurable simulated latency, so no API key or network access is needed.
+Every backend runs in its own interpreter and temporary directory:
+process_video ingests one synthetic video per `--minutes` entry, then
+VideoChatBot.query answers `--queries` questions.
+
+Reported per backend: ingest chunks/sec, query p50/p95/p99 latency, questions/sec
+answered by VideoChatBot.query one at a time and by one query_batch call, and peak
+Python memory (tracemalloc, which slows allocations, so only compare runs made
+with the same settings). pgvector is included when DATABASE_URL is set; the
+benchmark videos are written to that database with "bench-" ids.
+
+Threshold flags turn the run into a regression gate (non-zero exit), e.g. in CI:
+    python -m benchmarks.bench_pipeline --backends numpy --min-chunks-per-sec 50 --max-p95-ms 150
+
+Run from the repository root:
+    python -m benchmarks.bench_pipeline [--backends numpy,chromaDB,pgvector] [--minutes 5,30,60]
+        [--queries 50] [--llm-latency 0.05] [--embedding-latency 0.02] [--json report.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKENDS = ("numpy", "chromaDB", "pgvector")
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run_backend(args):
+    """
+    Ingest and query with the fakes patched in; runs inside the backend's own interpreter.
+
+    :return: Report dictionary of the backend
+    """
+    import langchain_openai
+    import youtube_transcript_api
+
+    from youtube_chatbot import context_builder, database, metrics, video_processor
+    from youtube_chatbot.chatbot import VideoChatBot
+    from youtube_chatbot.fakes import (TRANSCRIPT_WORDS, FakeChatModel, FakeEmbeddings, FakeTranscriptApi,
+                                       fake_video_details)
+
+    embeddings = FakeEmbeddings(latency=args.embedding_latency)
+    llm = FakeChatModel(latency=args.llm_latency)
+    # process_video imports the clients when it runs, so patching the source modules is enough
+    langchain_openai.OpenAIEmbeddings = lambda **kwargs: embeddings
+    langchain_openai.ChatOpenAI = lambda **kwargs: llm
+
+    # pgvector keeps the videos of previous runs, the other backends start from an empty directory
+    prefix = f"bench-{int(time.time())}" if args.run_backend == "pgvector" else "bench"
+    warm_up_id = f"{prefix}-warm-up"
+    minutes_by_video = {f"{prefix}-{i}-{minutes}m": minutes for i, minutes in enumerate(args.minutes)}
+    minutes_by_video[warm_up_id] = 1
+    transcript_api = FakeTranscriptApi(minutes_by_video, latency=args.fetch_latency)
+    youtube_transcript_api.YouTubeTranscriptApi = lambda: transcript_api
+    video_processor.get_video_details = lambda video_id: fake_video_details(video_id, minutes_by_video[video_id])
+    try:
+        video_processor.token_counter(video_processor.TOKEN_ENCODING)
+    except Exception:
+        # tiktoken downloads its encodings on first use, count words when they are not available offline
+        print("tiktoken encoding unavailable, counting chunk and context tokens as words", file=sys.stderr)
+        video_processor.token_counter = lambda encoding_name: FakeChatModel().get_num_tokens
+        context_builder.token_counter = video_processor.token_counter
+
+    chunk_counts = []
+    store_many_to_db = video_processor.store_many_to_db
+
+    def counting_store_many_to_db(records):
+        chunk_counts.append(sum(1 for record in records if record.get('chunk_id')))
+        store_many_to_db(records)
+
+    video_processor.store_many_to_db = counting_store_many_to_db
+
+    if args.run_backend == "pgvector":
+        from youtube_chatbot.db_admin import create_schema
+        create_schema()
+    elif args.run_backend == "chromaDB":
+        # Chroma keeps the vectors, the relational tables live in DATABASE_URL (a local SQLite file by default)
+        database.Base.metadata.create_all(database.get_engine())
+
+    devnull = open(os.devnull, "w")
+    # Lazy imports and client start-up are paid once per worker, keep them out of the measurements
+    with contextlib.redirect_stdout(devnull):
+        video_processor.process_video(warm_up_id)
+    chunk_counts.clear()
+    metrics.registry.reset()
+    tracemalloc.start()
+
+    videos = []
+    ingest_started = time.perf_counter()
+    for video_id, minutes in minutes_by_video.items():
+        if video_id == warm_up_id:
+            continue
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(devnull):
+            if video_processor.process_video(video_id) is not True:
+                raise RuntimeError(f"process_video failed for {video_id}")
+        seconds = time.perf_counter() - started
+        videos.append({'minutes': minutes, 'chunks': chunk_counts[-1], 'seconds': round(seconds, 3),
+                       'chunks_per_sec': round(chunk_counts[-1] / seconds, 1)})
+    ingest_seconds = time.perf_counter() - ingest_started
+    ingest_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+
+    rng = random.Random(0)
+    words = [word for word in TRANSCRIPT_WORDS if word.isalpha()]
+    questions = [" ".join(rng.sample(words, rng.randint(2, 5))) for _ in range(args.queries)]
+    latencies = []
+    with contextlib.redirect_stdout(devnull):
+        bot = VideoChatBot(embeddings=embeddings, llm=llm)
+        bot.query("warm up")
+        for question in questions:
+            started = time.perf_counter()
+            bot.query(question)
+            latencies.append(1000 * (time.perf_counter() - started))
+        # The same questions again, answered together
+        started = time.perf_counter()
+        bot.query_batch(questions)
+        batch_seconds = time.perf_counter() - started
+    query_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    latencies.sort()
+
+    chunks = sum(chunk_counts)
+    recorded = metrics.registry.to_dict()
+    stages = recorded['stages']
+    counters = {name: sum(entry['value'] for entry in entries) for name, entries in recorded['counters'].items()}
+    return {
+        'backend': args.run_backend,
+        'videos': videos,
+        'chunks': chunks,
+        'ingest_seconds': round(ingest_seconds, 3),
+        'chunks_per_sec': round(chunks / ingest_seconds, 1),
+        'queries': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'queries_per_sec': round(1000 * len(latencies) / sum(latencies), 1),
+        'batch_queries_per_sec': round(len(questions) / batch_seconds, 1),
+        'ingest_peak_mb': round(ingest_peak / 2 ** 20, 1),
+        'query_peak_mb': round(query_peak / 2 ** 20, 1),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        # Where the time went, per stage of the ingest and query paths
+        'stages': {stage: {'count': values['count'], 'sum_seconds': values['sum_seconds']}
+                   for stage, values in stages.items()},
+        # LLM calls and tokens of ingestion and queries together
+        'llm_calls': counters.get('llm_calls', 0),
+        'llm_tokens': counters.get('llm_tokens', 0),
+    }
+
+
+def spawn_backend(backend, argv):
+    """
+    Run one backend in a fresh interpreter and temporary directory.
+
+    :return: Report dictionary of the backend
+    """
+    with tempfile.TemporaryDirectory(prefix=f"bench-{backend}-") as directory:
+        env = dict(os.environ,
+                   PYTHONPATH=REPOSITORY_ROOT,
+                   DB_TYPE=backend,
+                   OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "offline"),
+                   NUMPY_STORE_DIRECTORY=os.path.join(directory, "numpy_db"),
+                   KEYWORD_INDEX_PATH=os.path.join(directory, "keyword_index.db"),
+                   INGEST_MARKER_PATH=os.path.join(directory, ".ingest-version"),
+                   ARTIFACT_STORE_PATH=os.path.join(directory, "artifacts.db"),
+                   # Every run must pay for its LLM and embedding calls
+                   LLM_CACHE_ENABLED="false",
+                   ANSWER_CACHE_ENABLED="false",
+                   ANONYMIZED_TELEMETRY="False")
+        if backend == "chromaDB" and not os.getenv("DATABASE_URL"):
+            env["DATABASE_URL"] = f"sqlite:///{os.path.join(directory, 'videos.db')}"
+        output = os.path.join(directory, "report.json")
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_pipeline", *argv,
+                        "--run-backend", backend, "--output", output],
+                       cwd=directory, env=env, check=True)
+        with open(output) as f:
+            return json.load(f)
+
+
+def check_thresholds(report, args):
+    """
+    :return: List of threshold violations of a backend report
+    """
+    failures = []
+    checks = (
+        ('chunks_per_sec', args.min_chunks_per_sec, lambda value, limit: value >= limit),
+        ('p95_ms', args.max_p95_ms, lambda value, limit: value <= limit),
+        ('p99_ms', args.max_p99_ms, lambda value, limit: value <= limit),
+        ('ingest_peak_mb', args.max_peak_mb, lambda value, limit: value <= limit),
+        ('query_peak_mb', args.max_peak_mb, lambda value, limit: value <= limit),
+    )
+    for key, limit, passes in checks:
+        if limit is not None and not passes(report[key], limit):
+            failures.append(f"{report['backend']}: {key}={report[key]} (limit {limit})")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default=None,
+                        help="comma separated (default: numpy,chromaDB, plus pgvector when DATABASE_URL is set)")
+    parser.add_argument("--minutes", type=lambda value: [float(m) for m in value.split(",")], default=[5, 30, 60],
+                        help="synthetic video lengths, one video per entry")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake LLM call")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="seconds per fake embedding request")
+    parser.add_argument("--fetch-latency", type=float, default=0.1, help="seconds per fake transcript fetch")
+    parser.add_argument("--min-chunks-per-sec", type=float)
+    parser.add_argument("--max-p95-ms", type=float)
+    parser.add_argument("--max-p99-ms", type=float)
+    parser.add_argument("--max-peak-mb", type=float, help="limit for the ingest and query tracemalloc peaks")
+    parser.add_argument("--json", help="write the reports to this file")
+    parser.add_argument("--run-backend", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_backend:
+        with open(args.output, "w") as f:
+            json.dump(run_backend(args), f)
+        return
+
+    if args.backends:
+        backends = args.backends.split(",")
+    else:
+        backends = ["numpy", "chromaDB"] + (["pgvector"] if os.getenv("DATABASE_URL") else [])
+    argv = ["--minutes", ",".join(str(m) for m in args.minutes), "--queries", str(args.queries),
+            "--llm-latency", str(args.llm_latency), "--embedding-latency", str(args.embedding_latency),
+            "--fetch-latency", str(args.fetch_latency)]
+
+    reports = []
+    failures = []
+    for backend in backends:
+        report = spawn_backend(backend, argv)
+        reports.append(report)
+        failures += check_thresholds(report, args)
+        for video in report['videos']:
+            print(f"{backend:>9} ingest {video['minutes']:6.1f} min: {video['chunks']:5d} chunks "
+                  f"in {video['seconds']:7.2f} s ({video['chunks_per_sec']:.1f} chunks/s)")
+        print(f"{backend:>9} total {report['chunks']} chunks, {report['chunks_per_sec']:.1f} chunks/s | "
+              f"query p50 {report['p50_ms']:.1f} ms p95 {report['p95_ms']:.1f} ms p99 {report['p99_ms']:.1f} ms, "
+              f"{report['queries_per_sec']:.1f}/s sequential, {report['batch_queries_per_sec']:.1f}/s query_batch | "
+              f"peak {report['ingest_peak_mb']:.1f} MB ingest, {report['query_peak_mb']:.1f} MB query, "
+              f"RSS {report['max_rss_mb']:.0f} MB | {report['llm_calls']} LLM calls, {report['llm_tokens']} tokens")
+        print(f"{backend:>9} stages: " + ", ".join(
+            f"{stage} {values['sum_seconds']:.2f}s/{values['count']}" for stage, values in report['stages'].items()))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+    if failures:
+        sys.exit("Benchmark thresholds exceeded:\n" + "\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
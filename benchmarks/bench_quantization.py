@@ -0,0 +1,144 @@
+"""
+Recall versus memory of quantized first-pass vector search.
+
+Builds a clustered synthetic corpus of unit vectors and compares, against exact
+float32 search, the representations a first pass can scan:
+- halfvec: float16, what pgvector's halfvec index holds (PGVECTOR_QUANTIZATION=halfvec)
+- int8:    one int8 code per dimension plus a float32 scale per row (NUMPY_QUANTIZATION=int8)
+- bit:     the sign of each dimension compared by Hamming distance (PGVECTOR_QUANTIZATION=bit)
+
+For each re-rank factor the first pass keeps factor * k candidates, which are
+re-ranked with the float32 vectors (factor 1 is the first pass alone). recall@k
+is the share of the exact top k that is found. The numpy store is then timed
+with and without its int8 codes on the same corpus. pgvector index recall also
+depends on the HNSW/IVFFlat settings, check it with `db_admin explain`.
+
+Run from the repository root:
+    python -m benchmarks.bench_quantization [--rows 50000] [--queries 200] [-k 10] [--rerank 1,2,4,10]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from youtube_chatbot.database import EMBEDDING_DIMENSION
+from youtube_chatbot.numpy_store import NumpyVectorStore
+
+# Number of set bits of every byte value, to count Hamming distances on packed bits
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint16)
+
+
+def synthetic_corpus(rows, queries, dimension, clusters, seed=0):
+    """
+    :return: (corpus, queries) of unit float32 vectors; queries are perturbed corpus rows
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension), dtype=np.float32)
+    corpus = centers[rng.integers(0, clusters, rows)] + rng.standard_normal((rows, dimension), dtype=np.float32)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    picked = corpus[rng.integers(0, rows, queries)]
+    query_vectors = picked + 0.05 * rng.standard_normal(picked.shape, dtype=np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return corpus, query_vectors
+
+
+def top(scores, k):
+    """
+    :return: Row indexes of the k highest scores, best first
+    """
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def first_pass_methods(corpus):
+    """
+    :return: {name: (bytes per row, score function of a query)} for each quantized representation
+    """
+    half = corpus.astype(np.float16)
+    scales = np.abs(corpus).max(axis=1) / 127
+    codes = np.rint(corpus / scales[:, None]).astype(np.int8)
+    bits = np.packbits(corpus > 0, axis=1)
+
+    def bit_scores(query):
+        # Smaller Hamming distance is better
+        return -POPCOUNT[np.bitwise_xor(bits, np.packbits(query > 0))].sum(axis=1, dtype=np.int32)
+
+    return {
+        'halfvec': (half.shape[1] * 2, lambda query: half @ query.astype(np.float16)),
+        'int8': (codes.shape[1] + 4, lambda query: (codes.astype(np.float32) @ query) * scales),
+        'bit': (bits.shape[1], bit_scores),
+    }
+
+
+def recall_report(corpus, queries, k, factors):
+    exact = [set(top(corpus @ query, k)) for query in queries]
+    full_bytes = corpus.shape[1] * 4
+    print(f"{'method':>8} {'bytes/row':>10} {'memory':>8} {'first pass ms':>14} " +
+          " ".join(f"{f'recall x{factor}':>10}" for factor in factors))
+    print(f"{'float32':>8} {full_bytes:>10} {'100%':>8} {'':>14} " + " ".join(f"{1.0:>10.3f}" for _ in factors))
+    for name, (row_bytes, score) in first_pass_methods(corpus).items():
+        recalls = {factor: 0.0 for factor in factors}
+        seconds = 0.0
+        for query, expected in zip(queries, exact):
+            started = time.perf_counter()
+            scores = score(query)
+            seconds += time.perf_counter() - started
+            for factor in factors:
+                candidates = top(scores, min(k * factor, len(corpus)))
+                reranked = candidates[top(corpus[candidates] @ query, k)]
+                recalls[factor] += len(expected.intersection(reranked.tolist())) / k
+        print(f"{name:>8} {row_bytes:>10} {row_bytes / full_bytes:>8.1%} {1000 * seconds / len(queries):>14.2f} " +
+              " ".join(f"{recalls[factor] / len(queries):>10.3f}" for factor in factors))
+
+
+def store_report(corpus, queries, k):
+    """Time NumpyVectorStore searches with and without the int8 codes."""
+    records = [{'video_id': f"video-{i // 50}", 'chunk_id': f"chunk-{i}", 'embedding_vector': vector}
+               for i, vector in enumerate(corpus)]
+    with tempfile.TemporaryDirectory(prefix="bench-quantization-") as directory:
+        exact_store = NumpyVectorStore(directory)
+        exact_store.upsert(records)
+        quantized_store = NumpyVectorStore(directory, quantization="int8")
+        quantized_store.quantize()
+        codes_bytes = os.path.getsize(quantized_store.codes_path) + os.path.getsize(quantized_store.scales_path)
+        print(f"numpy store: {os.path.getsize(exact_store.matrix_path) / 2 ** 20:.1f} MB float32 matrix, "
+              f"{codes_bytes / 2 ** 20:.1f} MB int8 codes and scales")
+
+        results = {}
+        for label, store in (("float32", exact_store), ("int8", quantized_store)):
+            latencies, found = [], []
+            for query in queries:
+                started = time.perf_counter()
+                found.append([metadata['chunk_id'] for metadata, _ in store.search(query, k=k)])
+                latencies.append(1000 * (time.perf_counter() - started))
+            latencies.sort()
+            results[label] = found
+            print(f"{label:>8} store search p50 {latencies[len(latencies) // 2]:.2f} ms "
+                  f"p95 {latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]:.2f} ms")
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(results["float32"], results["int8"])])
+        print(f"    int8 store recall@{k}: {recall:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=EMBEDDING_DIMENSION)
+    parser.add_argument("--clusters", type=int, default=500, help="topics the synthetic vectors are drawn around")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--rerank", type=lambda value: [int(f) for f in value.split(",")], default=[1, 2, 4, 10],
+                        help="candidates kept per result before the float32 re-rank")
+    parser.add_argument("--skip-store", action="store_true", help="only compare the representations")
+    args = parser.parse_args()
+
+    corpus, queries = synthetic_corpus(args.rows, args.queries, args.dimension, args.clusters)
+    print(f"Synthetic corpus: {args.rows} x {args.dimension}, {args.queries} queries, recall@{args.k}")
+    recall_report(corpus, queries, args.k, args.rerank)
+    if not args.skip_store and args.dimension == EMBEDDING_DIMENSION:
+        store_report(corpus, queries, args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Micro-benchmark for transcript merging and chunk-to-timestamp mapping.
+
+Builds a synthetic 10-hour transcript and times merge_transcript_text plus
+split_text_with_metadata against the previous quadratic implementation.
+
+Run from the repository root:
+    python -m benchmarks.bench_transcript_split [--hours 10] [--chunk-size 500]
+"""
+import argparse
+import random
+import time
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from youtube_chatbot.utility import merge_transcript_text, split_text_with_metadata
+
+WORDS = ("data", "model", "vector", "query", "agent", "index", "prompt", "token", "chunk", "video",
+         "[Music]", "so", "the", "and", "we", "will", "now", "look", "at", "this")
+
+
+def synthetic_transcript(hours, seed=42):
+    rng = random.Random(seed)
+    transcript = []
+    start = 0.0
+    while start < hours * 3600:
+        duration = rng.uniform(1.5, 4.5)
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 10)))
+        transcript.append({"text": text, "start": round(start, 3), "duration": round(duration, 3)})
+        start += duration * rng.uniform(0.8, 1.0)
+    return transcript
+
+
+def legacy_merge_transcript_text(transcript):
+    merged_text = ""
+    segment_map = []
+    for segment in transcript:
+        start_idx = len(merged_text)
+        merged_text += segment["text"] + " "
+        end_idx = len(merged_text)
+        segment_map.append(
+            {"start": segment["start"], "duration": segment["duration"], "start_idx": start_idx, "end_idx": end_idx})
+    return merged_text.strip(), segment_map
+
+
+def legacy_split_text_with_metadata(text, segment_map, chunk_size=1000, overlap=50):
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap)
+    chunks = text_splitter.split_text(text)
+    split_segments = []
+    for chunk in chunks:
+        start_idx = text.find(chunk)
+        start_time, duration = None, 0
+        for segment in segment_map:
+            if segment["start_idx"] <= start_idx < segment["end_idx"]:
+                start_time = segment["start"]
+                break
+        if start_time is None:
+            start_time = segment_map[0]["start"]
+        for segment in segment_map:
+            if segment["start_idx"] <= start_idx + len(chunk) <= segment["end_idx"]:
+                duration += segment["duration"]
+        split_segments.append({"text": chunk, "start": start_time, "duration": duration})
+    return split_segments
+
+
+def timed(label, merge, split, transcript, chunk_size, overlap):
+    started = time.perf_counter()
+    text, segment_map = merge(transcript)
+    merged = time.perf_counter()
+    chunks = split(text, segment_map, chunk_size=chunk_size, overlap=overlap)
+    finished = time.perf_counter()
+    print(f"{label:>8}: merge {1000 * (merged - started):8.1f} ms | "
+          f"split+map {1000 * (finished - merged):9.1f} ms | {len(chunks)} chunks")
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=10)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--overlap", type=int, default=50)
+    parser.add_argument("--skip-legacy", action="store_true", help="only time the current implementation")
+    args = parser.parse_args()
+
+    transcript = synthetic_transcript(args.hours)
+    print(f"Synthetic transcript: {args.hours}h, {len(transcript)} segments")
+    chunks = timed("current", merge_transcript_text, split_text_with_metadata,
+                   transcript, args.chunk_size, args.overlap)
+    if not args.skip_legacy:
+        timed("legacy", legacy_merge_transcript_text, legacy_split_text_with_metadata,
+              transcript, args.chunk_size, args.overlap)
+
+    # Chunk start times must follow the transcript, even with repeated phrases
+    assert all(a["start"] <= b["start"] for a, b in zip(chunks, chunks[1:])), "chunk start times are not monotonic"
+
+
+if __name__ == "__main__":
+    main()
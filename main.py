@@ -1,11 +1,17 @@
-from youtube_chatbot import VideoChatBot, get_channel_videos, process_video, read_complete_table, read_chroma_db
-import os
 from dotenv import load_dotenv
 
-def get_transcript_and_process_video(videos):
-    for idx, video in enumerate(videos):
-        print(f"Processing video {video['id']} -- {idx + 1}/{len(videos)}: {video['title']}")
-        process_video(video['id'])
+# Settings are read when their module is imported, so .env is loaded before the imports below
+load_dotenv()
+
+from youtube_chatbot import VideoChatBot, get_channel_videos, process_video, read_complete_table, read_chroma_db, \
+    enqueue_videos, run_workers, sync_channel_videos
+from youtube_chatbot.metrics import configure_logging
+import os
+
+def get_transcript_and_process_video(videos, channel_id=None):
+    # Queue the videos so that an interrupted crawl resumes where it stopped
+    enqueue_videos(videos, channel_id=channel_id)
+    run_workers(int(os.getenv("INGEST_WORKERS", 1)))
 
 def get_transcript_and_process_by_video_id(video_ids):
     for vid in video_ids:
@@ -21,9 +27,14 @@ def initiate_question_answer_bot():
         if query.lower() in ['exit', 'quit']:
             break
 
-        response = bot.query(query)
+        # Answer tokens are printed as the model produces them
         print("\nBot:")
-        pretty_response:str = response['answer'].pretty_print()
+        for event in bot.stream_query(query):
+            if event['type'] == 'token':
+                print(event['content'], end='', flush=True)
+            elif event['type'] == 'done':
+                response = event
+        print()
         if response['answer'].content in "<TOPIC_NOT_FOUND>>":
             return
         print("\nReferences:")
@@ -39,11 +50,22 @@ def crawl_channel_by_channel_id():
     print(f"Fetching channel videos for {channel_id} ...")
     videos = get_channel_videos(channel_id) # Temp comment to save quota
     if videos:
-        get_transcript_and_process_video(videos)
+        get_transcript_and_process_video(videos, channel_id=channel_id)
     else:
         print('No Video found check you channel id')
 
 
+def sync_channel_by_channel_id():
+    """
+    Incremental crawl of a channel, only the videos published since the previous sync are fetched and processed
+    :return: None
+    """
+    channel_id = input(f"Enter the YouTube Channel ID you want to sync\n").strip()
+    new_videos = sync_channel_videos(channel_id)
+    print(f"{len(new_videos)} new videos queued for {channel_id}")
+    run_workers(int(os.getenv("INGEST_WORKERS", 1)))
+
+
 def crawl_videos_of_channel_by_video_id():
     # Example channel ID (replace with actual) [vbp7EjCck4M]
     video_id = input(f"Enter the YouTube video ID that you want to crawl for transcript building?\n")
@@ -64,7 +86,8 @@ def get_user_choice():
         "4": "Option 4: See existing Table information",
         "5": "Option 5: See Chroma DB information[Vector Information]",
         "6": "Option 6: Add to .env",
-        "7": "Option 7: Print .env"
+        "7": "Option 7: Print .env",
+        "8": "Option 8: Sync a Youtube channel by Channel Id (new videos only)"
     }
 
     print("Please choose an option:")
@@ -101,6 +124,8 @@ def process_user_input(choice):
             add_env_variable()
         case '7':
             print_env_file()
+        case '8':
+            sync_channel_by_channel_id()
         case 'exit':
             exit()
         case _:
@@ -108,7 +133,7 @@ def process_user_input(choice):
 
 
 if __name__ == "__main__":
-    load_dotenv()
+    configure_logging()
     openai = os.getenv("OPENAI_API_KEY")
     if not openai:
         openai = input("OPENAI_API_KEY is missing. Please enter your API key: \n").strip()
@@ -120,7 +145,8 @@ if __name__ == "__main__":
         os.environ["DB_TYPE"] = db_type  # Set the key for the session
 
     db_url = os.getenv("DATABASE_URL")
-    if not db_url:
+    # The numpy store is local files only, it does not need a database
+    if not db_url and db_type != "numpy":
         db_url = input("DATABASE_URL is missing. Please enter your API key: \n").strip()
         os.environ["DATABASE_URL"] = db_url  # Set the key for the session
     while True:
@@ -0,0 +1,11 @@
+from youtube_chatbot.artifact_store import ArtifactStore
+
+
+def test_append_if_changed_skips_duplicates(tmp_path):
+    store = ArtifactStore(str(tmp_path / "artifacts.db"))
+    chunks = [{'text': "a b", 'start': 0.5, 'duration': 1.25}]
+    assert store.append_if_changed('chunked_transcript', "video", chunks)
+    assert not store.append_if_changed('chunked_transcript', "video", chunks)
+    assert store.append_if_changed('chunked_transcript', "video", chunks * 2)
+    assert store.stats()['kinds']['chunked_transcript']['artifacts'] == 2
+    assert store.latest('chunked_transcript', "video") == chunks * 2
@@ -0,0 +1,30 @@
+from youtube_chatbot.context_builder import build_context, format_reference
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def doc(chunk_id, start, end, summary, video_id="v1"):
+    return {'metadata': {'chunk_id': chunk_id, 'video_id': video_id, 'title': "Title", 'url': f"u?t={start}",
+                         'start': start, 'end': end, 'summary': summary}}
+
+
+def test_best_reference_over_budget_is_truncated():
+    docs = [doc("v1-0", 0, 10, " ".join(f"word{i}" for i in range(200))), doc("v2-0", 0, 10, "short", "v2")]
+    references = build_context(docs, max_tokens=50, count_tokens=count_words)
+    assert references[0]['url'] == "u?t=0"
+    assert references[0]['summary'].startswith("word0 word1")
+    assert sum(count_words(format_reference(reference)) for reference in references) <= 50
+
+
+def test_empty_summaries_are_not_deduplicated_together():
+    docs = [doc("v1-0", 0, 10, ""), doc("v1-5", 100, 110, None), doc("v2-0", 0, 10, "", "v2")]
+    references = build_context(docs, max_tokens=1000, count_tokens=count_words)
+    assert len(references) == 3
+
+
+def test_same_chunk_retrieved_twice_is_kept_once():
+    docs = [doc("v1-0", 0, 10, "alpha"), doc("v1-0", 0, 10, "alpha"), doc("v1-9", 300, 310, "Alpha!")]
+    references = build_context(docs, max_tokens=1000, count_tokens=count_words)
+    assert [reference['summary'] for reference in references] == ["alpha"]
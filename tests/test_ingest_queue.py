@@ -0,0 +1,43 @@
+import importlib
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setenv("JOB_QUEUE_URL", f"sqlite:///{tmp_path / 'queue.db'}")
+    monkeypatch.setenv("JOB_LEASE_SECONDS", "1")
+    from youtube_chatbot import ingest_queue
+    yield importlib.reload(ingest_queue)
+    monkeypatch.undo()
+    importlib.reload(ingest_queue)
+
+
+def test_renewed_lease_is_not_reclaimed(queue):
+    queue.enqueue_videos([{'id': "v1", 'title': "Video"}])
+    assert queue.claim_next_job("a")['video_id'] == "v1"
+    time.sleep(0.6)
+    assert queue.renew_lease("v1", "a")
+    time.sleep(0.6)
+    assert queue.claim_next_job("b") is None
+
+
+def test_lost_lease_is_not_renewed(queue):
+    queue.enqueue_videos([{'id': "v1", 'title': "Video"}])
+    queue.claim_next_job("a")
+    time.sleep(1.1)
+    assert queue.claim_next_job("b")['video_id'] == "v1"
+    assert not queue.renew_lease("v1", "a")
+
+
+def test_heartbeat_renews_from_another_thread(queue, monkeypatch):
+    from youtube_chatbot import worker
+    monkeypatch.setattr(worker, "renew_lease", queue.renew_lease)
+    queue.enqueue_videos([{'id': "v1", 'title': "Video"}])
+    queue.claim_next_job("a")
+    with worker.lease_heartbeat("v1", "a", interval=0.2):
+        time.sleep(1.5)
+        assert queue.claim_next_job("b") is None
+    assert not [thread for thread in threading.enumerate() if thread.name == "lease-v1"]
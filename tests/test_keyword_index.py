@@ -0,0 +1,42 @@
+from youtube_chatbot.keyword_index import KeywordIndex, tokenize
+
+
+def chunk(i, summary):
+    return {'chunk_id': f"video_{i}", 'video_id': "video", 'summary': summary}
+
+
+def test_tokenize_drops_stopwords():
+    assert tokenize("What is the pgvector index?") == ["pgvector", "index"]
+
+
+def test_document_frequency_follows_upserts(tmp_path):
+    index = KeywordIndex(str(tmp_path / "keyword_index.db"))
+    index.upsert([chunk(0, "pgvector index"), chunk(1, "postgres index")])
+    index.upsert([chunk(0, "hnsw graph")])
+    terms = dict(index._connection.execute("SELECT term, df FROM terms").fetchall())
+    assert terms == {'index': 1, 'postgres': 1, 'hnsw': 1, 'graph': 1}
+
+
+def test_min_score(tmp_path):
+    index = KeywordIndex(str(tmp_path / "keyword_index.db"))
+    index.upsert([chunk(i, summary) for i, summary in enumerate(["pgvector index", "postgres data", "cooking"] * 5)])
+    # A young index still returns its matches
+    assert len(index.search("pgvector")) == 5
+    assert not index.search("pgvector", min_score=100)
+    assert not index.search("what is the weather")
+    # Weak matches far below the best one are dropped
+    assert {metadata['summary'] for metadata, _ in index.search("pgvector index data", min_score_ratio=0.9)} == \
+        {"pgvector index"}
+
+
+def test_partial_terms_table_is_migrated(tmp_path):
+    path = str(tmp_path / "keyword_index.db")
+    index = KeywordIndex(path)
+    index.upsert([chunk(0, "pgvector index"), chunk(1, "postgres index")])
+    # An index migrated halfway: stale terms rows and no schema version
+    index._connection.execute("DELETE FROM terms WHERE term = 'index'")
+    index._connection.execute("PRAGMA user_version = 0")
+    index._connection.commit()
+
+    terms = dict(KeywordIndex(path)._connection.execute("SELECT term, df FROM terms").fetchall())
+    assert terms == {'pgvector': 1, 'postgres': 1, 'index': 2}
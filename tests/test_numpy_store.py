@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+
+from youtube_chatbot.numpy_store import NumpyVectorStore
+
+DIMENSION = 16
+
+
+def records(start, count, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, DIMENSION), dtype=np.float32)
+    return [{'video_id': f"video_{(start + i) // 10}", 'chunk_id': f"chunk_{start + i}", 'embedding_vector': vector}
+            for i, vector in enumerate(vectors)]
+
+
+def found_ids(store, query, k=5):
+    return [metadata['chunk_id'] for metadata, _ in store.search(query, k=k)]
+
+
+def test_unquantized_writer_keeps_the_codes(tmp_path):
+    directory = str(tmp_path)
+    quantized = NumpyVectorStore(directory, dimension=DIMENSION, quantization="int8")
+    quantized.upsert(records(0, 1000))
+
+    # Grows the matrix past its first capacity without searching the codes itself
+    writer = NumpyVectorStore(directory, dimension=DIMENSION)
+    new_records = records(1000, 200, seed=1)
+    writer.upsert(new_records)
+
+    quantized.refresh()
+    assert quantized._codes.shape[0] == quantized._matrix.shape[0]
+    query = new_records[-1]['embedding_vector']
+    assert found_ids(quantized, query)[0] == "chunk_1199"
+
+
+def test_stale_codes_fall_back_to_exact_search(tmp_path):
+    directory = str(tmp_path)
+    store = NumpyVectorStore(directory, dimension=DIMENSION, quantization="int8")
+    store.upsert(records(0, 100))
+    exact = NumpyVectorStore(directory, dimension=DIMENSION)
+    query = records(0, 1, seed=2)[0]['embedding_vector']
+
+    # A writer that did not maintain the codes leaves the coded rows behind the matrix
+    with open(os.path.join(directory, "embeddings_int8.rows"), "w") as file:
+        file.write("50")
+    store.refresh()
+    assert found_ids(store, query, k=10) == found_ids(exact, query, k=10)
+
+    # The next write rebuilds the codes
+    store.upsert(records(100, 1, seed=3))
+    assert store._coded_rows == 101
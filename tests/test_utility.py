@@ -0,0 +1,53 @@
+from youtube_chatbot.utility import merge_transcript_text, shared_overlap, split_text_with_metadata
+
+
+def music_transcript(segments=2000, duration=2.0):
+    return [{'text': "[Music]", 'start': duration * i, 'duration': duration} for i in range(segments)]
+
+
+def test_repeated_segments_keep_their_timestamps():
+    full_text, segment_map = merge_transcript_text(music_transcript())
+    chunks = split_text_with_metadata(full_text, segment_map, chunk_size=500, overlap=50)
+
+    starts = [chunk['start'] for chunk in chunks]
+    # 500 characters hold 62 "[Music] " segments, 6 of them repeated as overlap
+    assert starts[:3] == [0.0, 112.0, 224.0]
+    assert chunks[-1]['start'] + chunks[-1]['duration'] == 4000.0
+
+
+def test_repeated_segments_measured_in_words():
+    full_text, segment_map = merge_transcript_text(music_transcript())
+    chunks = split_text_with_metadata(full_text, segment_map, chunk_size=100, overlap=10,
+                                      length_function=lambda text: len(text.split()))
+
+    assert [chunk['start'] for chunk in chunks[:3]] == [0.0, 180.0, 360.0]
+    assert chunks[-1]['start'] + chunks[-1]['duration'] == 4000.0
+
+
+def test_shared_overlap():
+    assert shared_overlap("alpha beta gamma", "beta gamma delta", overlap=20) == len("beta gamma")
+    assert shared_overlap("alpha beta gamma", "beta gamma delta", overlap=6) == 0
+    assert shared_overlap("alpha beta", "gamma delta", overlap=20) == 0
+
+
+def test_overlap_only_tail_chunk_after_whitespace_segments():
+    texts = ["alpha beta", " ", "", "gamma delta", "  ", "epsilon zeta", "eta", " "]
+    transcript = [{'text': text, 'start': float(i), 'duration': 1.0} for i, text in enumerate(texts)]
+    full_text, segment_map = merge_transcript_text(transcript)
+    chunks = split_text_with_metadata(full_text, segment_map, chunk_size=20, overlap=8)
+
+    # The last chunk is the overlap of the previous one alone
+    assert [chunk['text'] for chunk in chunks] == ["alpha beta    gamma", "gamma delta", "epsilon zeta eta", "eta"]
+    assert [chunk['start'] for chunk in chunks] == [0.0, 3.0, 5.0, 6.0]
+
+
+def test_overlap_only_tail_chunk_of_a_pause_section():
+    transcript = [{'text': "gamma beta epsilon", 'start': 0.0, 'duration': 2.0},
+                  {'text': "alpha gamma", 'start': 2.0, 'duration': 2.0},
+                  {'text': "eta", 'start': 6.0, 'duration': 2.0}]
+    full_text, segment_map = merge_transcript_text(transcript)
+    chunks = split_text_with_metadata(full_text, segment_map, chunk_size=30, overlap=10, pause_seconds=1)
+
+    # The first section ends in its separator, so its last chunk is the overlap alone
+    assert [(chunk['text'], chunk['start'], chunk['duration']) for chunk in chunks] == [
+        ("gamma beta epsilon alpha gamma", 0.0, 4.0), ("gamma", 2.0, 2.0), ("eta", 6.0, 2.0)]
@@ -0,0 +1,23 @@
+from youtube_chatbot.fakes import FakeChatModel
+from youtube_chatbot.video_processor import group_by_tokens, reduce_summaries
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def test_reduce_summaries_without_summaries():
+    assert reduce_summaries([], FakeChatModel()) == ""
+
+
+def test_reduce_summaries_larger_than_the_budget():
+    # Every summary exceeds the budget on its own, levels must still shrink
+    summary = reduce_summaries(["a b c d", "e f g h", "i j k l"], FakeChatModel(answer_words=5), max_tokens=2,
+                               count_tokens=count_words)
+    assert summary
+
+
+def test_group_by_tokens_min_size():
+    texts = ["a b c", "d e f", "g h i"]
+    assert group_by_tokens(texts, count_words, 2) == [["a b c"], ["d e f"], ["g h i"]]
+    assert group_by_tokens(texts, count_words, 2, min_size=2) == [["a b c", "d e f"], ["g h i"]]
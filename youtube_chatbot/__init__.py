@@ -1,12 +1,29 @@
-# Package initialization
-from .database import Base, Session, Video
-from .data_fetcher import get_channel_videos, get_video_details
-from .video_processor import process_video
-from .utility import read_complete_table, read_chroma_db
-from .chatbot import VideoChatBot
-
-__all__ = [
-    'Base', 'Session', 'Video',
-    'get_channel_videos', 'get_video_details',
-    'process_video', 'VideoChatBot', 'read_complete_table', 'read_chroma_db'
-]
\ No newline at end of file
+# Package initialization; importing it has no side effects, the CLI entry points load .env
+
+# Public names and the module defining them; modules are imported on first access,
+# so `import youtube_chatbot` stays cheap and never connects to a database
+_EXPORTS = {
+    'Base': 'database', 'Session': 'database', 'Video': 'database',
+    'get_channel_videos': 'data_fetcher', 'get_video_details': 'data_fetcher',
+    'sync_channel_videos': 'data_fetcher',
+    'process_video': 'video_processor',
+    'read_complete_table': 'utility', 'read_chroma_db': 'utility',
+    'VideoChatBot': 'chatbot',
+    'enqueue_videos': 'ingest_queue', 'queue_stats': 'ingest_queue',
+    'run_worker': 'worker', 'run_workers': 'worker',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+    value = getattr(import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
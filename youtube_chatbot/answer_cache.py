@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Semantic answer cache for VideoChatBot, keyed on the question embedding
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Minimum cosine similarity for a cached answer to be reused
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+# Seconds a cached answer stays valid
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+# File touched on every ingest, so bots in other processes drop stale answers
+INGEST_MARKER_PATH = os.getenv("INGEST_MARKER_PATH", ".ingest-version")
+
+
+def notify_ingest():
+    """Mark the index as changed, invalidating cached answers in every process."""
+    with open(INGEST_MARKER_PATH, "w", encoding="utf-8") as file:
+        file.write(str(time.time()))
+
+
+def get_ingest_version():
+    try:
+        return os.stat(INGEST_MARKER_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+class AnswerCache:
+    """
+    In-memory cache of chatbot answers looked up by question similarity.
+
+    Entries expire after `ttl` seconds, the least recently used entry is
+    dropped past `max_entries`, and the whole cache is cleared when new
+    chunks are ingested. Safe to share between threads.
+    """
+
+    def __init__(self, similarity_threshold=ANSWER_CACHE_SIMILARITY, ttl=ANSWER_CACHE_TTL,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # id -> (normalized vector, created_at, value)
+        self._next_id = 0
+        self._matrix = None
+        self._matrix_ids = []
+        self._ingest_version = get_ingest_version()
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _invalidate(self):
+        self._matrix = None
+        self._matrix_ids = []
+
+    def _prune(self):
+        version = get_ingest_version()
+        if version != self._ingest_version:
+            self._ingest_version = version
+            self._entries.clear()
+            self._invalidate()
+            return
+        expired = [key for key, (_, created_at, _) in self._entries.items() if time.time() - created_at > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._invalidate()
+
+    def lookup(self, vector):
+        """
+        :param vector: Question embedding
+        :return: Cached value of the most similar question above the threshold, or None
+        """
+        query = self._normalize(vector)
+        with self._lock:
+            self._prune()
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries)
+                self._matrix = np.stack([self._entries[key][0] for key in self._matrix_ids])
+            similarities = self._matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+            key = self._matrix_ids[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][2]
+
+    def store(self, vector, value):
+        with self._lock:
+            self._entries[self._next_id] = (self._normalize(vector), time.time(), value)
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._invalidate()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._invalidate()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
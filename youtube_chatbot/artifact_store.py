@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+from dotenv import load_dotenv
+
+if __name__ == "__main__":
+    # Settings are read when their module is imported, so .env is loaded before the imports below
+    load_dotenv()
+
+# Raw API responses and transcripts, kept so re-processing a video does not call YouTube again
+ARTIFACT_STORE_ENABLED = os.getenv("ARTIFACT_STORE_ENABLED", "true").lower() in ("1", "true", "yes")
+ARTIFACT_STORE_PATH = os.getenv("ARTIFACT_STORE_PATH", "artifacts.db")
+
+_default_store = None
+
+
+class ArtifactStore:
+    """
+    Append-only SQLite store of JSON artifacts, compressed with zlib.
+
+    Artifacts are addressed by a kind ("transcript", "video_details", ...) and a
+    key (video or channel id). Writes never rewrite older rows: reads return the
+    latest artifact of a kind and key, and export() walks the whole history.
+    Safe to share between threads; worker processes each open their own connection.
+    """
+
+    def __init__(self, path=ARTIFACT_STORE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # Concurrent workers append while others read
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, key TEXT, created REAL, data BLOB)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS artifacts_kind_key ON artifacts (kind, key)")
+        self._connection.commit()
+
+    @staticmethod
+    def _encode(value):
+        return zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+    @staticmethod
+    def _decode(data):
+        return json.loads(zlib.decompress(data))
+
+    def append(self, kind, key, value):
+        with self._lock:
+            self._connection.execute("INSERT INTO artifacts (kind, key, created, data) VALUES (?, ?, ?, ?)",
+                                     (kind, key, time.time(), self._encode(value)))
+            self._connection.commit()
+
+    def append_if_changed(self, kind, key, value):
+        """
+        Append value unless it equals the latest artifact of kind and key.
+
+        :return: True when the value was appended
+        """
+        if self.latest(kind, key) == value:
+            return False
+        self.append(kind, key, value)
+        return True
+
+    def latest(self, kind, key):
+        """
+        :return: The most recent artifact of kind and key, None when there is none
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data FROM artifacts WHERE kind = ? AND key = ? ORDER BY id DESC LIMIT 1", (kind, key)
+            ).fetchone()
+        return self._decode(row[0]) if row else None
+
+    def get_or_fetch(self, kind, key, fetch):
+        """
+        Return the latest artifact of kind and key, calling fetch() and appending its result when missing.
+        """
+        value = self.latest(kind, key)
+        if value is None:
+            self.misses += 1
+            value = fetch()
+            # Empty responses are not kept, the next call fetches again
+            if value:
+                self.append(kind, key, value)
+        else:
+            self.hits += 1
+        return value
+
+    def export(self, kind=None, latest_only=False):
+        """
+        Iterate over the stored artifacts in insertion order.
+
+        :param kind: Only export artifacts of this kind
+        :param latest_only: Skip artifacts superseded by a newer one of the same kind and key
+        :return: Generator of {'kind', 'key', 'created', 'data'} dictionaries
+        """
+        query = "SELECT kind, key, created, data FROM artifacts"
+        conditions, params = [], []
+        if kind:
+            conditions.append("kind = ?")
+            params.append(kind)
+        if latest_only:
+            conditions.append("id IN (SELECT MAX(id) FROM artifacts GROUP BY kind, key)")
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        # A separate connection streams the rows without holding the lock between them
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            for kind, key, created, data in connection.execute(query + " ORDER BY id", params):
+                yield {'kind': kind, 'key': key, 'created': created, 'data': self._decode(data)}
+        finally:
+            connection.close()
+
+    def stats(self):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT kind, COUNT(*), SUM(LENGTH(data)) FROM artifacts GROUP BY kind"
+            ).fetchall()
+        return {'hits': self.hits, 'misses': self.misses,
+                'kinds': {kind: {'artifacts': count, 'bytes': size} for kind, count, size in rows}}
+
+
+def get_artifact_store():
+    """
+    :return: The process-wide ArtifactStore, or None when ARTIFACT_STORE_ENABLED is off
+    """
+    global _default_store
+    if ARTIFACT_STORE_ENABLED and _default_store is None:
+        _default_store = ArtifactStore()
+    return _default_store
+
+
+def fetch_artifact(kind, key, fetch):
+    """
+    Serve an artifact from the store, or call fetch() and store its result; calls fetch() when the store is off.
+    """
+    store = get_artifact_store()
+    return store.get_or_fetch(kind, key, fetch) if store else fetch()
+
+
+def record_artifact(kind, key, value, if_changed=False):
+    """
+    Append an artifact to the store; with `if_changed`, only when it differs from the latest one of kind and key.
+    """
+    store = get_artifact_store()
+    if store:
+        if if_changed:
+            store.append_if_changed(kind, key, value)
+        else:
+            store.append(kind, key, value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the stored artifacts as JSON lines.")
+    parser.add_argument("--path", default=ARTIFACT_STORE_PATH)
+    parser.add_argument("--kind", help="only export this kind, e.g. transcript or video_details")
+    parser.add_argument("--latest", action="store_true", help="only the latest artifact per kind and key")
+    parser.add_argument("--output", help="file to write (default: stdout)")
+    parser.add_argument("--stats", action="store_true", help="print the artifact counts and sizes per kind")
+    args = parser.parse_args()
+
+    store = ArtifactStore(args.path)
+    if args.stats:
+        print(json.dumps(store.stats()['kinds'], indent=2))
+        return
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for artifact in store.export(kind=args.kind, latest_only=args.latest):
+            output.write(json.dumps(artifact) + "\n")
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
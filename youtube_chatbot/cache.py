@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.embeddings import Embeddings
+
+from .metrics import increment
+
+# Disk cache for LLM summaries and embeddings, keyed by model name plus a hash of the input text
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+# Maximum number of cached entries, least recently used entries are evicted first
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 200000))
+
+_default_cache = None
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    SQLite backed key/value cache with LRU eviction and hit/miss counters.
+
+    Entries are addressed by a namespace (model name, prompt version, ...) and
+    the input text; values are stored as JSON. Safe to share between threads.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, namespace TEXT, value TEXT, last_access REAL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)")
+        self._connection.commit()
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    @staticmethod
+    def make_key(namespace, text):
+        return hash_text(f"{namespace}\0{text}")
+
+    def get_many(self, namespace, texts):
+        """
+        :return: List with the cached value for each text, None for misses
+        """
+        keys = [self.make_key(namespace, text) for text in texts]
+        found = {}
+        with self._lock:
+            # Stay below SQLite's bound parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT key, value FROM cache WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+                self._connection.execute(
+                    f"UPDATE cache SET last_access = ? WHERE key IN ({placeholders})", [time.time(), *batch]
+                )
+            self._connection.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return [json.loads(found[key]) if key in found else None for key in keys]
+
+    def set_many(self, namespace, texts, values):
+        now = time.time()
+        rows = [(self.make_key(namespace, text), namespace, json.dumps(value), now)
+                for text, value in zip(texts, values)]
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", rows)
+            self._entries += len(rows)
+            if self._entries > self.max_entries:
+                # Recount first since replaced keys were counted as new entries
+                self._entries = self._connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+                excess = self._entries - self.max_entries
+                if excess > 0:
+                    self._connection.execute(
+                        "DELETE FROM cache WHERE key IN "
+                        "(SELECT key FROM cache ORDER BY last_access LIMIT ?)", (excess,)
+                    )
+                    self._entries -= excess
+            self._connection.commit()
+
+    def get(self, namespace, text):
+        return self.get_many(namespace, [text])[0]
+
+    def set(self, namespace, text, value):
+        self.set_many(namespace, [text], [value])
+
+    def get_or_compute(self, namespace, text, compute):
+        """
+        Return the cached value for text, calling compute() and caching its result on a miss.
+        """
+        value = self.get(namespace, text)
+        if value is None:
+            value = compute()
+            self.set(namespace, text, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': self._entries}
+
+
+def get_cache():
+    """
+    :return: The process-wide DiskCache, or None when LLM_CACHE_ENABLED is off
+    """
+    global _default_cache
+    if CACHE_ENABLED and _default_cache is None:
+        _default_cache = DiskCache()
+    return _default_cache
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves repeated texts from a DiskCache and only
+    sends the misses to the wrapped client, in a single request.
+    """
+
+    def __init__(self, embeddings, cache):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = getattr(embeddings, 'model', type(embeddings).__name__)
+        self.namespace = f"embedding:{self.model}"
+
+    def _count_request(self, texts):
+        increment("embedding_requests", model=self.model)
+        increment("embedding_texts", len(texts), model=self.model)
+
+    def embed_documents(self, texts):
+        if self.cache is None:
+            self._count_request(texts)
+            return self.embeddings.embed_documents(texts)
+        vectors = self.cache.get_many(self.namespace, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            self._count_request(missing)
+            computed = self.embeddings.embed_documents([texts[i] for i in missing])
+            computed = [list(map(float, vector)) for vector in computed]
+            self.cache.set_many(self.namespace, [texts[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text):
+        if self.cache is None:
+            self._count_request([text])
+            return self.embeddings.embed_query(text)
+        return self.cache.get_or_compute(self.namespace, text, lambda: self._embed_query(text))
+
+    def _embed_query(self, text):
+        self._count_request([text])
+        return self.embeddings.embed_query(text)
+
+
+def cached_batch(cache, namespace, chain, inputs, config=None):
+    """
+    Run chain.batch over inputs, serving the ones already computed from the cache.
+
+    :param cache: DiskCache, or None to disable caching
+    :param namespace: Cache namespace, should identify the model and the prompt
+    :param chain: Runnable returning JSON-serializable outputs (e.g. strings)
+    :param inputs: List of string inputs
+    :param config: Runnable config passed to chain.batch (e.g. max_concurrency)
+    :return: List of outputs in input order
+    """
+    if cache is None:
+        return chain.batch(inputs, config=config)
+    outputs = cache.get_many(namespace, inputs)
+    missing = [i for i, output in enumerate(outputs) if output is None]
+    if missing:
+        computed = chain.batch([inputs[i] for i in missing], config=config)
+        cache.set_many(namespace, [inputs[i] for i in missing], computed)
+        for i, output in zip(missing, computed):
+            outputs[i] = output
+    return outputs
@@ -1,52 +1,178 @@
-from langchain_openai import OpenAIEmbeddings
-from langchain_chroma import Chroma
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import AIMessage
 from dotenv import load_dotenv
+import logging
 import os
-from .database import get_db_url, pgvector_query
+import time
+from .answer_cache import ANSWER_CACHE_ENABLED, AnswerCache
+from .cache import CachedEmbeddings, get_cache
+from .context_builder import build_context, format_reference
+from .database import (get_db_url, chroma_query_many, pgvector_query, pgvector_query_many, pgvector_video_query,
+                       pgvector_video_query_many, CHROMA_PERSIST_DIRECTORY, CHROMA_COLLECTION_NAME)
+from .keyword_index import get_keyword_index, reciprocal_rank_fusion
+from .metrics import observe, timed, token_usage_callback
+
+# "flat" searches every chunk, "two_stage" first ranks videos by their summary
+# embedding and only searches the chunks of the top VIDEO_FANOUT videos
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "flat")
+VIDEO_FANOUT = int(os.getenv("VIDEO_FANOUT", 5))
+# Fuse BM25 keyword matches with the vector matches (reciprocal rank fusion)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() in ("1", "true", "yes")
+# Candidates taken from each ranking before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 10))
+# Maximum number of LLM answers generated at once by query_batch
+QUERY_BATCH_MAX_CONCURRENCY = int(os.getenv("QUERY_BATCH_MAX_CONCURRENCY", 8))
+
+logger = logging.getLogger(__name__)
 
 class VideoChatBot:
-    def __init__(self):
+    def __init__(self, embeddings=None, llm=None):
+        """
+        :param embeddings: Embeddings client, defaults to OpenAIEmbeddings
+        :param llm: Chat model, defaults to gpt-3.5-turbo (tests and load tests pass fakes)
+        """
         load_dotenv()
         openai = os.getenv("OPENAI_API_KEY")
-        if not openai:
+        if not openai and (embeddings is None or llm is None):
             openai = input("OPENAI_API_KEY is missing. Please enter your API key: ").strip()
             os.environ["OPENAI_API_KEY"] = openai  # Set the key for the session
 
-        self.embeddings = OpenAIEmbeddings(
-            # model="text-embedding-3-large"
-        )
+        # OpenAI and Chroma clients are imported only when they are used
+        if embeddings is None:
+            from langchain_openai import OpenAIEmbeddings
+            embeddings = OpenAIEmbeddings(
+                # model="text-embedding-3-large"
+            )
+        if llm is None:
+            from langchain_openai import ChatOpenAI
+            # stream_usage reports token usage at the end of streamed answers too
+            llm = ChatOpenAI(temperature=0.1, model="gpt-3.5-turbo", stream_usage=True)
+
+        # Exact repeats of a question are embedded from the disk cache
+        self.embeddings = CachedEmbeddings(embeddings, get_cache())
+        # Answers to repeated and near-duplicate questions, invalidated on ingest
+        self.answer_cache = AnswerCache() if ANSWER_CACHE_ENABLED else None
         self.db_type = os.getenv("DB_TYPE", "ChromaDB")  # Default to ChromaDB
         self.db_connection:str = get_db_url()  # Default to ChromaDB
-        self.llm = ChatOpenAI(temperature=0.1, model="gpt-3.5-turbo")
+        self.llm = llm
+        self.keyword_index = get_keyword_index() if HYBRID_SEARCH else None
 
-        if self.db_type == "ChromaDB":
+        if self.db_type.lower() == "chromadb":
+            from langchain_chroma import Chroma
             self.vectorstore = Chroma(
                 embedding_function=self.embeddings,
-                persist_directory="./chroma_db"
+                collection_name=CHROMA_COLLECTION_NAME,
+                persist_directory=CHROMA_PERSIST_DIRECTORY
             )
-    def query(self, question):
+
+    def retrieve(self, question, query_embedding, k=3):
+        video_ids = None
+        if RETRIEVAL_MODE == "two_stage" and self.db_type in ("pgvector", "numpy"):
+            # Coarse stage: narrow the chunk search to the videos whose summary matches best
+            with timed("video_search"):
+                if self.db_type == "pgvector":
+                    video_ids = pgvector_video_query(query_embedding, k=VIDEO_FANOUT)
+                else:
+                    from .numpy_store import numpy_video_query
+                    video_ids = numpy_video_query(query_embedding, k=VIDEO_FANOUT)
+            logger.debug("Searching chunks of %d videos: %s", len(video_ids), video_ids)
+            if not video_ids:
+                return []
+
+        candidates = max(k, HYBRID_CANDIDATES) if self.keyword_index else k
+        with timed("vector_search"):
+            docs = self.vector_search(question, query_embedding, video_ids, candidates)
+        # Without a chunk within the vector distance threshold the question is off-topic,
+        # keyword matches alone would still give it context
+        if not self.keyword_index or not docs:
+            return docs
+
+        # Exact names, codes and jargon are often missed by the embedding search alone
+        with timed("keyword_search"):
+            keyword_docs = [{'metadata': metadata} for metadata, score in
+                            self.keyword_index.search(question, k=candidates, video_ids=video_ids)]
+        return reciprocal_rank_fusion(docs, keyword_docs)[:k]
+
+    def vector_search(self, question, query_embedding, video_ids, k):
         if self.db_type == "pgvector":
-            print('Using pgvector for similarity search')
-            docs = pgvector_query(embeddings=self.embeddings, question= question)
+            logger.debug("Using pgvector for similarity search")
+            return pgvector_query(embeddings=self.embeddings, question= question, query_embedding=query_embedding,
+                                  video_id=video_ids, k=k)
+        elif self.db_type == "numpy":
+            logger.debug("Using NumPy store for similarity search")
+            from .numpy_store import numpy_query
+            return numpy_query(query_embedding, video_id=video_ids, k=k)
         else:
-            print('Using ChromaDB for similarity search')
-            docs = self.vectorstore.similarity_search(question, k=3)
-
-        results = []
-        for doc in docs:
-            metadata = doc.get('metadata',None)
-            if not metadata:
-                continue
-            results.append({
-                'title': metadata['title'],
-                'url': metadata['url'],
-                'start': metadata['start'],
-                'end': metadata['end'],
-                'summary': metadata['summary'],
-            })
+            logger.debug("Using ChromaDB for similarity search")
+            documents = self.vectorstore.similarity_search_by_vector(query_embedding, k=k)
+            # Same shape as pgvector_query output
+            return [{
+                'metadata': {
+                    'chunk_id': doc.metadata.get('video_chunk_id'),
+                    'video_id': doc.metadata.get('video_id'),
+                    'title': doc.metadata.get('title'),
+                    'url': doc.metadata.get('url'),
+                    'start': doc.metadata.get('start_time'),
+                    'end': doc.metadata.get('end_time'),
+                    'summary': doc.metadata.get('summary'),
+                }
+            } for doc in documents if doc.metadata.get('video_chunk_id')]
+
+    def retrieve_many(self, questions, query_embeddings, k=3):
+        """
+        Batched retrieve: every search stage runs once for all the questions.
+
+        :return: List with the retrieve output of each question
+        """
+        video_ids = None
+        if RETRIEVAL_MODE == "two_stage" and self.db_type in ("pgvector", "numpy"):
+            with timed("batch_video_search"):
+                if self.db_type == "pgvector":
+                    video_ids = pgvector_video_query_many(query_embeddings, k=VIDEO_FANOUT)
+                else:
+                    from .numpy_store import numpy_video_query_many
+                    video_ids = numpy_video_query_many(query_embeddings, k=VIDEO_FANOUT)
+
+        # Questions whose coarse stage found no video get no chunks, as in retrieve
+        searched = [i for i in range(len(questions)) if video_ids is None or video_ids[i]]
+        candidates = max(k, HYBRID_CANDIDATES) if self.keyword_index else k
+        docs = [[] for _ in questions]
+        with timed("batch_vector_search"):
+            found = self.vector_search_many([query_embeddings[i] for i in searched],
+                                            None if video_ids is None else [video_ids[i] for i in searched],
+                                            candidates)
+        for i, question_docs in zip(searched, found):
+            docs[i] = question_docs
+        if not self.keyword_index:
+            return docs
+
+        with timed("batch_keyword_search"):
+            for i in searched:
+                if not docs[i]:
+                    continue  # off-topic, as in retrieve
+                keyword_docs = [{'metadata': metadata} for metadata, score in self.keyword_index.search(
+                    questions[i], k=candidates, video_ids=None if video_ids is None else video_ids[i])]
+                docs[i] = reciprocal_rank_fusion(docs[i], keyword_docs)[:k]
+        return docs
+
+    def vector_search_many(self, query_embeddings, video_ids, k):
+        """
+        :return: List with the vector_search output of each query, from one search call
+        """
+        if self.db_type == "pgvector":
+            return pgvector_query_many(query_embeddings, video_ids=video_ids, k=k)
+        elif self.db_type == "numpy":
+            from .numpy_store import numpy_query_many
+            return numpy_query_many(query_embeddings, video_ids=video_ids, k=k)
+        # ChromaDB has no two-stage retrieval, so there are never video ids here
+        return chroma_query_many(query_embeddings, k=k)
+
+    def build_references(self, docs):
+        # Adjacent chunks of a video become one reference, within the CONTEXT_MAX_TOKENS budget
+        return build_context(docs)
+
+    def build_prompt(self, question, results):
         # Provide reference of video and timeline if applicable hyperlinked with url
-        context = "\n".join([f"Video: {r['title']}\nSummary: {r['summary']}\n Video Time: start:{r['start']} end: {r['end']}\n Video snipped url: {r['url']}" for r in results])
+        context = "\n".join([format_reference(r) for r in results])
         prompt = f"""
          <<Instructions>>
         - Answer the question based strictly on the following context. 
@@ -63,10 +189,123 @@ class VideoChatBot:
         Question: {question}
         <<User's Question>> 
         """
-        # print(f"Prompt: {prompt}")
+        logger.debug("Prompt: %s", prompt)
+        return prompt
+
+    def query(self, question):
+        with timed("query"):
+            return self._query(question)
 
-        response = self.llm.invoke(prompt)
-        return {
+    def _query(self, question):
+        with timed("query_embedding"):
+            query_embedding = self.embeddings.embed_query(question)
+        if self.answer_cache:
+            cached = self.answer_cache.lookup(query_embedding)
+            if cached:
+                logger.info("Answer served from cache")
+                return cached
+
+        results = self.build_references(self.retrieve(question, query_embedding))
+        with timed("llm_answer"):
+            response = self.llm.invoke(self.build_prompt(question, results),
+                                       config={"callbacks": [token_usage_callback()]})
+        answer = {
             'answer': response,
             'references': results
         }
+        if self.answer_cache:
+            self.answer_cache.store(query_embedding, answer)
+        return answer
+
+    def query_batch(self, questions, max_concurrency=QUERY_BATCH_MAX_CONCURRENCY):
+        """
+        Answer several questions, e.g. an evaluation set or a queue of user questions.
+
+        The questions are embedded with one embed_documents request, each search stage
+        runs once for all of them, and the LLM answers are generated concurrently.
+
+        :param questions: Questions to answer
+        :param max_concurrency: Maximum number of LLM requests in flight at once
+        :return: List with the query output of each question, in order
+        """
+        with timed("query_batch"):
+            return self._query_batch(list(questions), max_concurrency)
+
+    def _query_batch(self, questions, max_concurrency):
+        if not questions:
+            return []
+        with timed("batch_query_embedding"):
+            query_embeddings = self.embeddings.embed_documents(questions)
+
+        answers = [None] * len(questions)
+        pending = []
+        for i, query_embedding in enumerate(query_embeddings):
+            cached = self.answer_cache.lookup(query_embedding) if self.answer_cache else None
+            if cached:
+                answers[i] = cached
+            else:
+                pending.append(i)
+        logger.info("Answering %d questions, %d served from cache", len(questions), len(questions) - len(pending))
+        if not pending:
+            return answers
+
+        docs = self.retrieve_many([questions[i] for i in pending], [query_embeddings[i] for i in pending])
+        references = [self.build_references(question_docs) for question_docs in docs]
+        prompts = [self.build_prompt(questions[i], results) for i, results in zip(pending, references)]
+        with timed("batch_llm_answer"):
+            # Runnable.batch runs on a thread pool and returns results in input order
+            responses = self.llm.batch(prompts, config={"max_concurrency": max_concurrency,
+                                                        "callbacks": [token_usage_callback()]})
+        for i, response, results in zip(pending, responses, references):
+            answers[i] = {
+                'answer': response,
+                'references': results
+            }
+            if self.answer_cache:
+                self.answer_cache.store(query_embeddings[i], answers[i])
+        return answers
+
+    def stream_query(self, question):
+        """
+        Streaming version of query.
+
+        Yields events as dicts:
+        - {'type': 'references', 'references': [...]} as soon as retrieval finishes
+        - {'type': 'token', 'content': str} for each piece of the answer as the LLM produces it
+        - {'type': 'done', 'answer': AIMessage, 'references': [...], 'time_to_first_token': seconds}
+        """
+        started = time.perf_counter()
+        with timed("query_embedding"):
+            query_embedding = self.embeddings.embed_query(question)
+        cached = self.answer_cache.lookup(query_embedding) if self.answer_cache else None
+        if cached:
+            logger.info("Answer served from cache")
+            yield {'type': 'references', 'references': cached['references']}
+            yield {'type': 'token', 'content': cached['answer'].content}
+            yield {'type': 'done', **cached, 'time_to_first_token': time.perf_counter() - started}
+            return
+
+        results = self.build_references(self.retrieve(question, query_embedding))
+        yield {'type': 'references', 'references': results}
+
+        message = None
+        time_to_first_token = None
+        answer_started = time.perf_counter()
+        for chunk in self.llm.stream(self.build_prompt(question, results),
+                                     config={"callbacks": [token_usage_callback()]}):
+            if time_to_first_token is None:
+                time_to_first_token = time.perf_counter() - started
+                observe("time_to_first_token", time_to_first_token)
+            message = chunk if message is None else message + chunk
+            if chunk.content:
+                yield {'type': 'token', 'content': chunk.content}
+
+        observe("llm_answer", time.perf_counter() - answer_started)
+        observe("query", time.perf_counter() - started)
+        answer = {
+            'answer': AIMessage(content=message.content if message else ""),
+            'references': results
+        }
+        if self.answer_cache:
+            self.answer_cache.store(query_embedding, answer)
+        yield {'type': 'done', **answer, 'time_to_first_token': time_to_first_token}
@@ -6,6 +6,15 @@ Instructions:
 
 """
 
+VIDEO_SUMMARY_TEMPLATE = """
+Below are the summaries of consecutive parts of a video, in order: {text}
+
+Instructions:
+- Write one concise summary of the whole content, keeping the main topics in the order they are discussed
+- Do not describe the summaries themselves or mention that the text is split in parts
+
+"""
+
 
 QUERY_TEMPLATE = """
 Answer the question based strictly on the following context. Do not include any information outside of this context.
@@ -0,0 +1,153 @@
+import os
+import re
+
+from .utility import TOKEN_ENCODING, token_counter
+
+# Token budget of the references placed in the answer prompt
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", 1500))
+# Retrieved chunks of the same video at most this many seconds apart become one reference
+CONTEXT_MERGE_GAP_SECONDS = float(os.getenv("CONTEXT_MERGE_GAP_SECONDS", 5))
+
+
+def format_reference(reference):
+    """
+    :return: Context text of a reference in the answer prompt
+    """
+    return (f"Video: {reference['title']}\nSummary: {reference['summary']}\n "
+            f"Video Time: start:{reference['start']} end: {reference['end']}\n Video snipped url: {reference['url']}")
+
+
+def _content_key(text):
+    # Case, punctuation and spacing differences do not make a summary new content
+    return " ".join(re.findall(r"\w+", (text or "").lower()))
+
+
+def _chunk_key(metadata):
+    if metadata.get('chunk_id'):
+        return 'chunk', metadata.get('video_id'), metadata['chunk_id']
+    return 'window', metadata.get('video_id') or metadata.get('url'), metadata.get('start'), metadata.get('end')
+
+
+def _touches(window, start, end, gap_seconds):
+    if None in (window['start'], window['end'], start, end):
+        return False
+    return start <= window['end'] + gap_seconds and window['start'] <= end + gap_seconds
+
+
+def merge_windows(docs, gap_seconds=CONTEXT_MERGE_GAP_SECONDS):
+    """
+    Merge the retrieved chunks of the same video whose time windows overlap or are at
+    most `gap_seconds` apart, dropping chunks retrieved twice (same chunk id, or same
+    video and time window) and chunks that repeat an earlier non-empty summary.
+
+    :param docs: Retrieved docs ({'metadata': {...}} as returned by pgvector_query), most relevant first
+    :param gap_seconds: Largest gap between two windows that are still merged
+    :return: List of windows {'video_id', 'start', 'end', 'chunks': [(rank, metadata)]}, most relevant first
+    """
+    windows = []
+    seen = set()
+    for rank, doc in enumerate(docs):
+        metadata = doc.get('metadata')
+        if not metadata:
+            continue
+        keys = {_chunk_key(metadata)}
+        content = _content_key(metadata.get('summary'))
+        if content:
+            keys.add(('summary', content))
+        if keys & seen:
+            continue
+        seen |= keys
+
+        window = {
+            'video_id': metadata.get('video_id') or metadata.get('url'),
+            'start': metadata.get('start'),
+            'end': metadata.get('end'),
+            'chunks': [(rank, metadata)],
+        }
+        # A chunk can bridge two windows of its video, so it absorbs every window it touches
+        for other in [other for other in windows if other['video_id'] == window['video_id']
+                      and _touches(other, window['start'], window['end'], gap_seconds)]:
+            windows.remove(other)
+            window = {
+                'video_id': window['video_id'],
+                'start': min(window['start'], other['start']),
+                'end': max(window['end'], other['end']),
+                'chunks': other['chunks'] + window['chunks'],
+            }
+        windows.append(window)
+    return sorted(windows, key=lambda window: min(rank for rank, _ in window['chunks']))
+
+
+def window_reference(chunks):
+    """
+    :param chunks: (rank, metadata) of the chunks of one window
+    :return: Reference covering the chunks, with their summaries in transcript order
+    """
+    chunks = sorted((metadata for _, metadata in chunks),
+                    key=lambda metadata: (metadata.get('start') is None, metadata.get('start')))
+    first = chunks[0]
+    ends = [metadata['end'] for metadata in chunks if metadata.get('end') is not None]
+    return {
+        'title': first['title'],
+        # The url of the earliest chunk starts playback at the beginning of the window
+        'url': first['url'],
+        'start': first['start'],
+        'end': max(ends) if ends else first['end'],
+        'summary': " ".join(metadata['summary'] for metadata in chunks if metadata.get('summary')),
+    }
+
+
+def truncate_reference(reference, max_tokens, count_tokens):
+    """
+    :return: Copy of the reference with the longest summary prefix (in words) whose formatted
+        text fits `max_tokens`, None when even an empty summary does not fit
+    """
+    words = (reference['summary'] or "").split()
+    low, high = -1, len(words)
+    # Largest number of words that fits, by binary search on the token count
+    while low < high:
+        middle = (low + high + 1) // 2
+        text = " ".join(words[:max(middle, 0)])
+        if count_tokens(format_reference({**reference, 'summary': text})) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    if low < 0:
+        return None
+    return {**reference, 'summary': " ".join(words[:low])}
+
+
+def build_context(docs, max_tokens=CONTEXT_MAX_TOKENS, count_tokens=None, gap_seconds=CONTEXT_MERGE_GAP_SECONDS):
+    """
+    Turn retrieved docs into the references of the answer prompt: adjacent and overlapping
+    chunks of a video are merged, repeated summaries dropped, and references are added in
+    relevance order while their formatted text fits `max_tokens`. A most relevant
+    reference longer than the whole budget is truncated rather than dropped.
+
+    :param docs: Retrieved docs, most relevant first
+    :param max_tokens: Token budget of the formatted references
+    :param count_tokens: Token counting function, tiktoken's TOKEN_ENCODING when None
+    :param gap_seconds: Largest gap between two chunks of a video that are merged
+    :return: List of references {'title', 'url', 'start', 'end', 'summary'}, most relevant first
+    """
+    count_tokens = count_tokens or token_counter(TOKEN_ENCODING)
+    references = []
+    used = 0
+    for window in merge_windows(docs, gap_seconds):
+        reference = window_reference(window['chunks'])
+        tokens = count_tokens(format_reference(reference))
+        if used + tokens > max_tokens and len(window['chunks']) > 1:
+            # The whole window does not fit, keep its most relevant chunk
+            reference = window_reference([min(window['chunks'], key=lambda chunk: chunk[0])])
+            tokens = count_tokens(format_reference(reference))
+        if used + tokens > max_tokens:
+            if references:
+                continue
+            # The best evidence alone exceeds the budget, keep as much of it as fits
+            reference = truncate_reference(reference, max_tokens, count_tokens)
+            if reference is None:
+                continue
+            tokens = count_tokens(format_reference(reference))
+        references.append(reference)
+        used += tokens
+    return references
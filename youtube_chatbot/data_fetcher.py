@@ -1,9 +1,14 @@
-from googleapiclient.discovery import build
-from .utility import append_response_to_json, read_json_file
+from .artifact_store import fetch_artifact, record_artifact
+from .utility import read_json_file
 import isodate
 from dotenv import load_dotenv
+import logging
 import os
-from .database import Session, Video
+from .database import Session, Video, retrieve_processed_video_ids
+from .ingest_queue import enqueue_videos, get_channel_sync_state, save_channel_sync_state
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
 
 def get_youtube_service():
     """Initialize and return a YouTube API client."""
@@ -13,6 +18,8 @@ def get_youtube_service():
     if not api_key:
         api_key = input("YOUTUBE_API_KEY is missing. Please enter your API key: ").strip()
 
+    # The discovery client is slow to import, only load it when the API is called
+    from googleapiclient.discovery import build
     return build('youtube', 'v3', developerKey=api_key)
 
 def get_channel_videos(channel_id, max_results=1):
@@ -23,36 +30,100 @@ def get_channel_videos(channel_id, max_results=1):
         :param max_results: Number of videos to fetch (default is 1)
         :return: List of video details (ID and title)
     """
+    videos, _ = fetch_channel_videos(channel_id, max_results=max_results)
+    return videos
+
+
+def fetch_channel_videos(channel_id, max_results=1, published_after=None, etag=None):
+    """
+        Pages through the videos of a YouTube channel.
+
+        :param channel_id: ID of the YouTube channel
+        :param max_results: Number of videos to fetch per page
+        :param published_after: Only fetch videos published at or after this RFC 3339 time (newest first)
+        :param etag: ETag of the first page of a previous identical request
+        :return: Tuple (videos, etag of the first page); videos is None when the ETag still matches
+    """
+    from googleapiclient.errors import HttpError
     youtube = get_youtube_service()
+    params = {}
+    if published_after:
+        params['publishedAfter'] = published_after
+        params['order'] = 'date'
     request = youtube.search().list(
         part="id,snippet",
         channelId=channel_id,
         maxResults=max_results,
         type="video",
-        eventType="completed"
+        eventType="completed",
+        **params
     )
+    if etag:
+        request.headers['If-None-Match'] = etag
     videos = []
+    first_page_etag = None
     while request:
-        response = request.execute()
-        print(f"response={response}")
+        try:
+            with timed("youtube_api"):
+                response = request.execute()
+        except HttpError as e:
+            if e.resp.status == 304:
+                logger.info("No change on channel %s since the last sync", channel_id)
+                return None, etag
+            raise
+        first_page_etag = first_page_etag or response.get('etag')
+        logger.debug("response=%s", response)
         videos.extend(
-            {'id': item['id']['videoId'], 'title': item['snippet']['title']}
+            {'id': item['id']['videoId'], 'title': item['snippet']['title'],
+             'published_at': item['snippet'].get('publishedAt')}
             for item in response.get('items', [])
         )
         request = youtube.search().list_next(request, response)
+        if request is not None:
+            request.headers.pop('If-None-Match', None)
 
-    print(f"videos={videos}")
-    append_response_to_json(videos, f'{channel_id}-video-list.json')
-    return videos
+    logger.debug("videos=%s", videos)
+    record_artifact('video_list', channel_id, videos)
+    return videos, first_page_etag
+
+
+def sync_channel_videos(channel_id, page_size=50):
+    """
+        Incremental channel crawl: requests only the videos published since the last sync,
+        drops the ones already processed with a single database query and queues the rest.
+        The channel's high-water mark is saved once the new videos are safely queued.
+
+        :param channel_id: ID of the YouTube channel
+        :param page_size: Number of videos per API page (YouTube allows up to 50)
+        :return: List of queued video details not processed yet (ID, title and publishedAt)
+    """
+    state = get_channel_sync_state(channel_id) or {}
+    last_published_at = state.get('last_published_at')
+    logger.info("Syncing channel %s since %s", channel_id, last_published_at or 'the beginning')
+
+    videos, etag = fetch_channel_videos(channel_id, max_results=page_size,
+                                        published_after=last_published_at, etag=state.get('etag'))
+    if videos is None:
+        return []
+
+    processed = retrieve_processed_video_ids(video['id'] for video in videos)
+    new_videos = [video for video in videos if video['id'] not in processed]
+    logger.info("%d videos since last sync, %d not processed yet", len(videos), len(new_videos))
+    enqueue_videos(new_videos, channel_id=channel_id)
+
+    published = [video['published_at'] for video in videos if video.get('published_at')]
+    # RFC 3339 UTC timestamps sort lexicographically
+    save_channel_sync_state(channel_id, max(published, default=last_published_at), etag=etag)
+    return new_videos
 
 def get_video_details(video_id):
     """
-      Retrieves video details either from the database or the YouTube API.
+      Retrieves video details either from the artifact store or the YouTube API.
 
       :param video_id: The ID of the video
       :return: Dictionary containing video details (ID, length, title)
       """
-    return get_video_by_id_from_api(video_id)
+    return fetch_artifact('video_details', video_id, lambda: get_video_by_id_from_api(video_id))
 
 def get_video_by_id_from_api(video_id):
     """
@@ -62,12 +133,12 @@ def get_video_by_id_from_api(video_id):
       :return: Dictionary containing video ID, length, and title
     """
     youtube = get_youtube_service()
-    # Below is temp code to save quota
-    response = youtube.videos().list(
-        part="contentDetails,snippet",
-        id=video_id
-    ).execute()
-    append_response_to_json(response, f'{video_id}-video-details.json')
+    with timed("youtube_api"):
+        response = youtube.videos().list(
+            part="contentDetails,snippet",
+            id=video_id
+        ).execute()
+    record_artifact('video_details_response', video_id, response)
 
     if response is None:
         return {}
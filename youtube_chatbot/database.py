@@ -1,22 +1,40 @@
+import logging
 import os
+import threading
+from contextlib import contextmanager
 
-from dotenv import load_dotenv
-from sqlalchemy import create_engine, Column, Integer, Text, desc
-from sqlalchemy.orm import sessionmaker, declarative_base, Session
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from langchain_core.documents import Document
-from pgvector.sqlalchemy import Vector
+from sqlalchemy import (cast, create_engine, func, literal, select, true, tuple_, union_all, Column, Float, Integer,
+                        Text, TypeDecorator, desc, text)
+from sqlalchemy.sql import ClauseElement
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import sessionmaker, declarative_base, scoped_session, Session
+
+from .keyword_index import get_keyword_index
+from .metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Dimension of the stored embeddings (OpenAI embeddings), shared by every backend
+EMBEDDING_DIMENSION = 1536
+# Candidates kept by a quantized first pass per requested result, re-ranked at full precision
+QUANTIZATION_RERANK_FACTOR = int(os.getenv("QUANTIZATION_RERANK_FACTOR", 4))
 
 # Define the database models
 Base = declarative_base()
-# Set up the database engine and session only for pgvector
-load_dotenv()
-DB_TYPE = os.getenv("DB_TYPE", "pgvector")  # Set to "pgvector" or "chroma"
+# The engine and sessions are created on first use, so importing the package never connects
+DB_TYPE = os.getenv("DB_TYPE", "pgvector")  # Set to "pgvector", "chromaDB" or "numpy"
 database_url = None
-session:Session
+# Connection pool settings, shared by all threads of the process
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+engine = None
+# Thread-local session registry: every thread gets its own Session on the shared pool
+session:scoped_session = None
+_connect_lock = threading.Lock()
 def connect_db():
-    global session, database_url
+    global engine, session, database_url
     database_url = os.getenv("DATABASE_URL")
     # Update with actual URL chromaDB it should be sqllite and pgvector its postgres
 
@@ -27,12 +45,88 @@ def connect_db():
         raise ValueError("DATABASE_URL is missing. Please provide the PostgreSQL connection string.")
 
     # Create an SQLAlchemy engine using the DATABASE_URL
-    engine = create_engine(database_url)
-    session_local = sessionmaker(bind=engine)
-    session = session_local()
+    pool_options = {}
+    if not database_url.startswith("sqlite"):
+        pool_options = {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_recycle": DB_POOL_RECYCLE,
+        }
+    # pre_ping replaces connections dropped by the server instead of failing the next query
+    engine = create_engine(database_url, pool_pre_ping=True, **pool_options)
+    # Rows returned by the helpers stay readable after their session is closed
+    session_local = sessionmaker(bind=engine, expire_on_commit=False)
+    session = scoped_session(session_local)
+
+
+def get_engine():
+    """
+    :return: The process-wide engine, connecting to DATABASE_URL on first use
+    """
+    with _connect_lock:
+        if engine is None:
+            connect_db()
+    return engine
+
+
+@contextmanager
+def session_scope():
+    """
+    Transaction on the current thread's session: commits on success, rolls back
+    on error, and always returns the connection to the pool.
+    """
+    get_engine()
+    db_session = session()
+    try:
+        yield db_session
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        session.remove()
+
+# ANN index search parameters for pgvector, unset keeps the server defaults
+PGVECTOR_EF_SEARCH = os.getenv("PGVECTOR_EF_SEARCH")
+PGVECTOR_PROBES = os.getenv("PGVECTOR_PROBES")
+# "halfvec" or "bit": run the first pass on a half-precision or binary quantized expression index
+# (db_admin create-indexes --quantization) and re-rank its candidates with the full vectors
+PGVECTOR_QUANTIZATION = os.getenv("PGVECTOR_QUANTIZATION") or None
+
+CHROMA_PERSIST_DIRECTORY = "./chroma_db"
+# Default collection used by langchain_chroma.Chroma, which the chatbot reads from
+CHROMA_COLLECTION_NAME = "langchain"
+# Number of documents sent to ChromaDB per upsert
+CHROMA_BATCH_SIZE = int(os.getenv("CHROMA_BATCH_SIZE", 500))
+_chroma_collection = None
+
+
+class Embedding(TypeDecorator):
+    """
+    pgvector `vector` column. pgvector is only imported once a statement using the
+    column is compiled, so the backends that never query it do not load it.
+    """
+    impl = Text
+    cache_ok = True
+
+    def __init__(self, dimension=EMBEDDING_DIMENSION):
+        super().__init__()
+        self.dimension = dimension
 
-if DB_TYPE in ('pgvector', 'sqlite'):
-    connect_db()
+    def load_dialect_impl(self, dialect):
+        from pgvector.sqlalchemy import Vector
+        return dialect.type_descriptor(Vector(self.dimension))
+
+    class comparator_factory(TypeDecorator.Comparator):
+        # Same operators as pgvector.sqlalchemy.Vector
+        def l2_distance(self, other):
+            return self.op('<->', return_type=Float)(other)
+
+        def max_inner_product(self, other):
+            return self.op('<#>', return_type=Float)(other)
+
+        def cosine_distance(self, other):
+            return self.op('<=>', return_type=Float)(other)
 
 
 # Video model for storing complete video summary
@@ -42,7 +136,7 @@ class Video(Base):
     title = Column(Text)
     length = Column(Integer)
     summary = Column(Text)
-    embedding =Column(Vector(1536))
+    embedding =Column(Embedding(EMBEDDING_DIMENSION))
 
     def print_details(self):
         print(f"Video ID: {self.video_id}")
@@ -59,7 +153,7 @@ class VideoChunk(Base):
     title = Column(Text)
     video_chunk_id = Column(Text, primary_key=True)
     summary = Column(Text)
-    embedding = Column(Vector(1536))
+    embedding = Column(Embedding(EMBEDDING_DIMENSION))
     start_time = Column(Integer)
     end_time = Column(Integer)
     url = Column(Text)
@@ -76,6 +170,11 @@ class VideoChunk(Base):
 
 # Function to store data into ChromaDB or PostgresSQL (pgvector)
 def store_to_db(**kwargs):
+    with timed("db_write"):
+        _store_to_db(kwargs)
+
+
+def _store_to_db(kwargs):
     if DB_TYPE == "pgvector":
         # Step 1: Store to relational DB with Vector enabled
         store_to_relational_database(**kwargs)
@@ -84,185 +183,410 @@ def store_to_db(**kwargs):
         store_to_chroma(**kwargs)
         #Step 2: Store to relational DB
         store_to_relational_database(**kwargs)
+    elif DB_TYPE == "numpy":
+        # Store to the in-process memory-mapped store, no database server needed
+        from .numpy_store import get_numpy_store
+        get_numpy_store().upsert([kwargs])
     else:
-        print("Unsupported DB_TYPE!")
+        logger.error("Unsupported DB_TYPE: %s", DB_TYPE)
+        return
+    update_search_indexes([kwargs])
+
+
+# Function to store a list of video and chunk records (same kwargs as store_to_db)
+def store_many_to_db(records):
+    with timed("db_write"):
+        _store_many_to_db(records)
+
+
+def _store_many_to_db(records):
+    if DB_TYPE == "pgvector":
+        store_many_to_relational_database(records)
+    elif DB_TYPE == "chromaDB":
+        store_many_to_chroma(records)
+        store_many_to_relational_database(records)
+    elif DB_TYPE == "numpy":
+        from .numpy_store import get_numpy_store
+        get_numpy_store().upsert(records)
+    else:
+        logger.error("Unsupported DB_TYPE: %s", DB_TYPE)
+        return
+    update_search_indexes(records)
+
+
+# Function to keep the local search structures in step with the stored records
+def update_search_indexes(records):
+    keyword_index = get_keyword_index()
+    if keyword_index:
+        with timed("keyword_index_write"):
+            keyword_index.upsert(records)
+    # Cached chatbot answers may be missing the new content
+    from .answer_cache import notify_ingest
+    notify_ingest()
+
+
+# Function to get the long-lived ChromaDB collection, opened on first use
+def get_chroma_collection():
+    global _chroma_collection
+    if _chroma_collection is None:
+        # chromadb is only imported when the chromaDB backend is used
+        from chromadb import PersistentClient
+        client = PersistentClient(path=CHROMA_PERSIST_DIRECTORY)
+        # Embeddings are always computed by the caller, so no embedding function is attached
+        _chroma_collection = client.get_or_create_collection(CHROMA_COLLECTION_NAME, embedding_function=None)
+    return _chroma_collection
 
 
 # Function to store video or chunk data into ChromaDB
 def store_to_chroma(**kwargs):
-    # Get the args
+    store_many_to_chroma([kwargs])
+
+
+# Function to store a list of video and chunk records (store_to_db kwargs) into ChromaDB
+def store_many_to_chroma(records, batch_size=CHROMA_BATCH_SIZE):
+    ids, documents, metadatas, vectors = [], [], [], []
+    for record in records:
+        video_id = record.get("video_id")
+        chunk_id = record.get("chunk_id", None)
+
+        metadata = {
+            "title": record.get("title"),
+            "summary": record.get("summary"),
+            "video_id": video_id,
+        }
+
+        # If it's a chunk, add chunk-specific metadata
+        if chunk_id:
+            metadata.update({
+                "video_chunk_id": chunk_id,
+                "start_time": record.get("start_time", None),
+                "end_time": record.get("end_time", None),
+                "url": record.get("url", None)
+            })
+
+        ids.append(f"{video_id}_{chunk_id}" if chunk_id else video_id)
+        documents.append(record.get("summary"))
+        metadatas.append(metadata)
+        vectors.append(record.get("embedding_vector"))
+
+    # Embed only the records that come without a precomputed vector
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        from langchain_openai import OpenAIEmbeddings
+        embedded = OpenAIEmbeddings().embed_documents([documents[i] for i in missing])
+        for i, vector in zip(missing, embedded):
+            vectors[i] = vector
+
+    # Store the documents in ChromaDB
+    collection = get_chroma_collection()
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        collection.upsert(
+            ids=ids[start:end],
+            embeddings=vectors[start:end],
+            documents=documents[start:end],
+            metadatas=metadatas[start:end]
+        )
+
+    logger.info("Stored %d documents to ChromaDB", len(ids))
+
+# Function to build a Video or VideoChunk row from store_to_db kwargs
+def build_record(**kwargs):
     video_id = kwargs.get("video_id")
     title = kwargs.get("title")
+    length = kwargs.get("length", 0)  # Default to 0 if length is not provided
     summary = kwargs.get("summary")
+    embedding_vector = kwargs.get("embedding_vector")
     chunk_id = kwargs.get("chunk_id", None)
-    start_time = kwargs.get("start_time", None)
-    end_time = kwargs.get("end_time", None)
-    url = kwargs.get("url", None)
-
-    embeddings = OpenAIEmbeddings()
 
-    metadata = {
-        "title": title,
-        "summary": summary,
-        "video_id": video_id,
-    }
-
-    # If it's a chunk, add chunk-specific metadata
-    if chunk_id:
-        metadata.update({
-            "video_chunk_id": chunk_id,
-            "start_time": start_time,
-            "end_time": end_time,
-            "url": url
-        })
-
-    # Create the document
-    doc = Document(page_content=summary, metadata=metadata)
-
-    # Store the document in ChromaDB
-    Chroma.from_documents(
-        documents=[doc],
-        embedding=embeddings,
-        ids=[f"{video_id}_{chunk_id}" if chunk_id else video_id],
-        persist_directory="./chroma_db"
+    if chunk_id is None:
+        # Video data
+        return Video(
+            video_id=video_id,
+            title=title,
+            length=length,
+            summary=summary,
+            embedding=embedding_vector  # Store the vector embedding
+        )
+    # Chunk data
+    return VideoChunk(
+        video_id=video_id,
+        title=title,
+        video_chunk_id=chunk_id,
+        summary=summary,
+        embedding=embedding_vector,  # Store the vector embedding
+        start_time=kwargs.get("start_time", None),
+        end_time=kwargs.get("end_time", None),
+        url=kwargs.get("url", None)
     )
 
-    # Print details
-    print(f"Stored to ChromaDB for Video ID: {video_id}")
-    if chunk_id:
-        print(f"Chunk ID: {chunk_id}, Start: {start_time}s, End: {end_time}s")
-    else:
-        print(f"Video Summary: {summary[:100]}...")
-
 
 # Function to store video or chunk data into PostgreSQL (pgvector)
 def store_to_relational_database(**kwargs):
     try:
         video_id = kwargs.get("video_id")
-        title = kwargs.get("title")
-        length = kwargs.get("length", 0)  # Default to 0 if length is not provided
         summary = kwargs.get("summary")
-        embedding_vector = kwargs.get("embedding_vector")
         chunk_id = kwargs.get("chunk_id", None)
         start_time = kwargs.get("start_time", None)
         end_time = kwargs.get("end_time", None)
-        url = kwargs.get("url", None)
-
-        if chunk_id is None:
-            # Storing video data
-            video = Video(
-                video_id=video_id,
-                title=title,
-                length=length,
-                summary=summary,
-                embedding=embedding_vector  # Store the vector embedding
-            )
-            session.merge(video)
-        else:
-            # Storing chunk data
-            chunk = VideoChunk(
-                video_id=video_id,
-                title=title,
-                video_chunk_id=chunk_id,
-                summary=summary,
-                embedding=embedding_vector,  # Store the vector embedding
-                start_time=start_time,
-                end_time=end_time,
-                url=url
-            )
-            session.merge(chunk)
 
-        session.commit()
+        with session_scope() as db_session:
+            db_session.merge(build_record(**kwargs))
 
-        # Print details
-        print(f"Stored to PostgresSQL (pgvector) for Video ID: {video_id}")
+        logger.info("Stored to PostgresSQL (pgvector) for Video ID: %s", video_id)
         if chunk_id:
-            print(f"Chunk ID: {chunk_id}, Start: {start_time}s, End: {end_time}s")
+            logger.debug("Chunk ID: %s, Start: %ss, End: %ss", chunk_id, start_time, end_time)
         else:
-            print(f"Video Summary: {summary[:100]}...")
+            logger.debug("Video Summary: %s...", summary[:100])
 
     except Exception as e:
-        if session:
-            session.rollback()
-        print(f"Database error: {e}")
-    finally:
-        if session:
-            session.close()
+        logger.error("Database error: %s", e)
+
+
+# Function to store a list of video and chunk records (store_to_db kwargs) into PostgreSQL (pgvector)
+def store_many_to_relational_database(records):
+    bulk_upsert_records([build_record(**record) for record in records])
+
+
+def bulk_upsert_records(records):
+    """
+    Upsert a list of Video/VideoChunk rows in a single transaction.
+
+    On PostgreSQL and SQLite this is one INSERT ... ON CONFLICT DO UPDATE per
+    table, sent with executemany; other dialects fall back to session.merge.
+
+    :param records: List of Video and/or VideoChunk instances
+    :return: Number of rows written
+    """
+    rows_by_model = {}
+    for record in records:
+        model = type(record)
+        key = tuple(getattr(record, column.name) for column in model.__table__.primary_key.columns)
+        # The last record wins when the same row appears twice, as with merge
+        rows_by_model.setdefault(model, {})[key] = {
+            column.name: getattr(record, column.name) for column in model.__table__.columns
+        }
+
+    try:
+        with session_scope() as db_session:
+            write_rows(db_session, rows_by_model)
+
+        written = sum(len(rows) for rows in rows_by_model.values())
+        logger.info("Stored %d rows to PostgresSQL (pgvector) in one transaction", written)
+        return written
+    except Exception as e:
+        logger.error("Database error: %s", e)
+        raise e
+
+
+def write_rows(db_session, rows_by_model):
+    dialect = db_session.get_bind().dialect.name
+    for model, rows in rows_by_model.items():
+        rows = list(rows.values())
+        if dialect in ("postgresql", "sqlite"):
+            insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+            stmt = insert(model.__table__)
+            primary_keys = [column.name for column in model.__table__.primary_key.columns]
+            stmt = stmt.on_conflict_do_update(
+                index_elements=primary_keys,
+                set_={name: stmt.excluded[name] for name in rows[0] if name not in primary_keys}
+            )
+            db_session.execute(stmt, rows)
+        else:
+            for row in rows:
+                db_session.merge(model(**row))
 
 # Function to retrieve video or chunk data by video_id from ChromaDB or PostgresSQL (pgvector) or sqlite
 def retrieve_from_db(video_id, chunk_id=None):
+    with timed("db_read"):
+        return _retrieve_from_db(video_id, chunk_id)
+
+
+def _retrieve_from_db(video_id, chunk_id=None):
     if DB_TYPE in ("pgvector","chromaDB"):
         return retrieve_from_relational_database(video_id, chunk_id)
+    elif DB_TYPE == "numpy":
+        from .numpy_store import get_numpy_store
+        metadata = get_numpy_store().get(video_id, chunk_id)
+        return build_record(**metadata) if metadata else None
     else:
-        print("Unsupported DB_TYPE!")
+        logger.error("Unsupported DB_TYPE: %s", DB_TYPE)
         return None
+
+# Function to find which of the given videos are already processed, with a single query
+def retrieve_processed_video_ids(video_ids):
+    video_ids = list(video_ids)
+    if not video_ids:
+        return set()
+    if DB_TYPE in ("pgvector", "chromaDB"):
+        with timed("db_read"), session_scope() as db_session:
+            rows = db_session.query(Video.video_id).filter(Video.video_id.in_(video_ids)).all()
+            return {row.video_id for row in rows}
+    elif DB_TYPE == "numpy":
+        from .numpy_store import get_numpy_store
+        store = get_numpy_store()
+        return {video_id for video_id in video_ids if store.get(video_id)}
+    else:
+        logger.error("Unsupported DB_TYPE: %s", DB_TYPE)
+        return set()
+
 # Function to retrieve video or chunk data from PostgresSQL (pgvector) or sqlite
 def retrieve_from_relational_database(video_id, chunk_id=None):
     try:
-        if chunk_id is None:
-            # Retrieve video data
-            video = (
-                session
-                    .query(Video)
-                    .filter(Video.video_id == video_id)
-                    .first()
-            )
-            if video:
-                print(f"Retrieved from PostgresSQL (pgvector) for Video ID: {video_id}")
-                print(f"Title: {video.title}")
-                print(f"Summary: {video.summary}")
-                return video
-            else:
-                print(f"No video found in PostgresSQL (pgvector) for Video ID: {video_id}")
-                return None
-        else:
-            # Retrieve chunk data
-            chunk = (
-                session
-                    .query(VideoChunk)
-                    .filter(VideoChunk.video_id == video_id,
-                            VideoChunk.video_chunk_id == chunk_id)
-                    .first()
-            )
-            if chunk:
-                print(f"Retrieved from PostgresSQL (pgvector) for Video ID: {video_id}, Chunk ID: {chunk_id}")
-                print(f"Start Time: {chunk.start_time}s, End Time: {chunk.end_time}s")
-                print(f"Summary: {chunk.summary}")
-                return chunk
-            else:
-                print(f"No chunk found in PostgreSQL (pgvector) for Video ID: {video_id}, Chunk ID: {chunk_id}")
-                return None
+        with session_scope() as db_session:
+            return _retrieve_from_relational_database(db_session, video_id, chunk_id)
     except Exception as e:
-        print(f"Database error: {e}")
+        logger.error("Database error: %s", e)
         raise e
-    finally:
-        if session:
-            session.close()
 
-def pgvector_query(embeddings:OpenAIEmbeddings, question, video_id = None, threshold = .5):
+
+def _retrieve_from_relational_database(db_session, video_id, chunk_id=None):
+    if chunk_id is None:
+        # Retrieve video data
+        video = (
+            db_session
+                .query(Video)
+                .filter(Video.video_id == video_id)
+                .first()
+        )
+        if video:
+            logger.debug("Retrieved from PostgresSQL (pgvector) for Video ID: %s, Title: %s", video_id, video.title)
+            return video
+        else:
+            logger.debug("No video found in PostgresSQL (pgvector) for Video ID: %s", video_id)
+            return None
+    else:
+        # Retrieve chunk data
+        chunk = (
+            db_session
+                .query(VideoChunk)
+                .filter(VideoChunk.video_id == video_id,
+                        VideoChunk.video_chunk_id == chunk_id)
+                .first()
+        )
+        if chunk:
+            logger.debug("Retrieved from PostgresSQL (pgvector) for Video ID: %s, Chunk ID: %s, Start: %ss, End: %ss",
+                         video_id, chunk_id, chunk.start_time, chunk.end_time)
+            return chunk
+        else:
+            logger.debug("No chunk found in PostgreSQL (pgvector) for Video ID: %s, Chunk ID: %s", video_id, chunk_id)
+            return None
+
+def apply_search_params(db_session):
+    """
+    Set the per-transaction ANN search parameters (PGVECTOR_EF_SEARCH for HNSW,
+    PGVECTOR_PROBES for IVFFlat) on a PostgreSQL session.
+    """
+    if db_session.get_bind().dialect.name != "postgresql":
+        return
+    if PGVECTOR_EF_SEARCH:
+        db_session.execute(text(f"SET LOCAL hnsw.ef_search = {int(PGVECTOR_EF_SEARCH)}"))
+    if PGVECTOR_PROBES:
+        db_session.execute(text(f"SET LOCAL ivfflat.probes = {int(PGVECTOR_PROBES)}"))
+
+
+def quantized_embedding(column):
+    """
+    :return: The expression indexed by db_admin create-indexes --quantization, for `column`
+    """
+    from pgvector.sqlalchemy import BIT, HALFVEC
+    if PGVECTOR_QUANTIZATION == "halfvec":
+        return cast(column, HALFVEC(EMBEDDING_DIMENSION))
+    if PGVECTOR_QUANTIZATION == "bit":
+        return cast(func.binary_quantize(column), BIT(EMBEDDING_DIMENSION))
+    raise ValueError(f"Unsupported PGVECTOR_QUANTIZATION: {PGVECTOR_QUANTIZATION}")
+
+
+def quantized_distance(column, query_embedding):
+    """
+    :return: First pass distance between `column` and the query, served by the quantized index
+    """
+    if not isinstance(query_embedding, ClauseElement):
+        query_embedding = cast(literal(query_embedding, Embedding()), Embedding())
+    quantized = quantized_embedding(column)
+    if PGVECTOR_QUANTIZATION == "bit":
+        return quantized.hamming_distance(quantized_embedding(query_embedding))
+    return quantized.cosine_distance(quantized_embedding(query_embedding))
+
+
+def rerank_query(db_session, model, columns, query_embedding, filters=(), k=3):
+    """
+    Query `columns` plus the full-precision cosine "distance" of the k nearest `model` rows.
+
+    Without PGVECTOR_QUANTIZATION this is one ORDER BY distance LIMIT k. With it, the
+    QUANTIZATION_RERANK_FACTOR * k nearest rows by the quantized distance are selected
+    first, and only those are ranked by the full vectors.
+    """
+    # The distance is computed once in the select list and the ORDER BY refers to it,
+    # which is the ORDER BY distance LIMIT k shape the HNSW/IVFFlat indexes serve
+    distance = model.embedding.cosine_distance(query_embedding).label("distance")
+    query = db_session.query(*columns, distance)
+    if PGVECTOR_QUANTIZATION:
+        primary_keys = list(model.__table__.primary_key.columns)
+        # Only correlated with the query list of pgvector_query_many, never with the outer table
+        candidates = (select(*primary_keys)
+                      .where(*filters)
+                      .order_by(quantized_distance(model.embedding, query_embedding))
+                      .limit(k * QUANTIZATION_RERANK_FACTOR)
+                      .correlate_except(model.__table__))
+        query = query.filter(tuple_(*primary_keys).in_(candidates))
+    else:
+        query = query.filter(*filters)
+    return query.order_by(distance).limit(k)
+
+
+def build_pgvector_query(db_session, query_embedding, video_id = None, k = 3):
+    filters = []
+    if isinstance(video_id, (list, tuple, set)):
+        filters.append(VideoChunk.video_id.in_(video_id))
+    elif video_id:
+        filters.append(VideoChunk.video_id == video_id)
+    return rerank_query(db_session, VideoChunk, [VideoChunk], query_embedding, filters=filters, k=k)
+
+
+def pgvector_video_query(query_embedding, k = 5):
+    """
+    Rank videos by the distance between the query and their full summary embedding.
+
+    :param query_embedding: Query vector
+    :param k: Number of videos to return
+    :return: List of video ids, closest first
+    """
+    with session_scope() as db_session:
+        apply_search_params(db_session)
+        rows = rerank_query(db_session, Video, [Video.video_id], query_embedding, k=k).all()
+        return [row.video_id for row in rows]
+
+
+# video_id may be a single id or a list of ids (e.g. the videos picked by pgvector_video_query)
+def pgvector_query(embeddings, question, video_id = None, threshold = .5, query_embedding = None, k = 3):
     # Assuming the vector search using pgvector is done using cosine similarity
-    # query_embedding = embeddings.embed_query(question)
-    # Get embedding for the query
-    query_embedding = embeddings.embed_query(question)
-    # # Convert NumPy array to Python list (pgvector uses arrays, not bytearrays)
-    # query_vector = query_embedding.tolist()
+    # Get embedding for the query, unless the caller already has it
+    if query_embedding is None:
+        query_embedding = embeddings.embed_query(question)
 
     # Build query with optional video_id filter
-    query = session.query(VideoChunk, VideoChunk.embedding.cosine_distance(query_embedding).label("distance"))
-    if video_id:
-        query = query.filter(VideoChunk.video_id == video_id)
-    if threshold:
-        query = query.filter(VideoChunk.embedding.cosine_distance(query_embedding) < threshold)
-
-    query = query.order_by(VideoChunk.embedding.cosine_distance(query_embedding))
-    query = query.limit(3)
-    print('Query:',str(query))
-
-    # Execute query, limit to top 3 results
-    results = query.all()
-    # Format the output
-    docs = [{
+    with session_scope() as db_session:
+        apply_search_params(db_session)
+        query = build_pgvector_query(db_session, query_embedding, video_id=video_id, k=k)
+        logger.debug("Query: %s", query)
+
+        # Execute query, limit to top k results. The threshold is applied to the k
+        # nearest rows, a WHERE on the distance would evaluate it a second time
+        results = [(row, distance) for row, distance in query.all() if not threshold or distance < threshold]
+    for row,distance in results:
+        logger.debug("distance: %s chunk: %s", distance, row.video_chunk_id)
+
+    return [chunk_doc(row) for row, distance in results]
+
+
+def chunk_doc(row):
+    """
+    :return: Search result of a VideoChunk (or a row with its columns), as returned by pgvector_query
+    """
+    return {
         'metadata': {
+            'chunk_id': row.video_chunk_id,
             'video_id': row.video_id,
             'title': row.title,
             'url': row.url,
@@ -270,13 +594,94 @@ def pgvector_query(embeddings:OpenAIEmbeddings, question, video_id = None, thres
             'end': row.end_time,
             'summary': row.summary,
         }
-    } for row,distance in results]
+    }
 
-    for row,distance in results:
-        print(f'distance: {distance}')
-        print(row.print_details())
 
+def build_pgvector_many_query(db_session, model, columns, query_embeddings, video_ids=None, k=3):
+    """
+    One statement running the rerank_query search of every query embedding: the queries
+    are a derived table joined LATERAL to the search, which keeps using the ANN index.
+
+    :param video_ids: Optional list with the video ids each query is restricted to
+    :return: Query of (position, *columns, distance) rows, ordered by query position then distance
+    """
+    vector_type = Embedding()
+    selects = []
+    for position, query_embedding in enumerate(query_embeddings):
+        values = [literal(position, Integer).label("position"),
+                  cast(literal(query_embedding, vector_type), vector_type).label("embedding")]
+        if video_ids is not None:
+            values.append(cast(literal(list(video_ids[position]), ARRAY(Text)), ARRAY(Text)).label("video_ids"))
+        selects.append(select(*values))
+    queries = union_all(*selects).subquery("queries")
+
+    filters = [] if video_ids is None else [model.video_id == queries.c.video_ids.any_()]
+    matches = rerank_query(db_session, model, columns, queries.c.embedding, filters=filters, k=k).statement
+    matches = matches.lateral("matches")
+    return (db_session.query(queries.c.position, matches)
+            .select_from(queries)
+            .join(matches, true())
+            .order_by(queries.c.position, matches.c.distance))
+
+
+def pgvector_query_many(query_embeddings, video_ids=None, threshold=.5, k=3):
+    """
+    Chunk similarity search of several queries in one SQL statement.
+
+    :param query_embeddings: Query vectors
+    :param video_ids: Optional list with a list of video ids per query (e.g. from pgvector_video_query_many)
+    :return: List with the pgvector_query output of each query
+    """
+    if not query_embeddings:
+        return []
+    columns = [VideoChunk.video_id, VideoChunk.video_chunk_id, VideoChunk.title, VideoChunk.url,
+               VideoChunk.start_time, VideoChunk.end_time, VideoChunk.summary]
+    docs = [[] for _ in query_embeddings]
+    with session_scope() as db_session:
+        apply_search_params(db_session)
+        query = build_pgvector_many_query(db_session, VideoChunk, columns, query_embeddings, video_ids=video_ids, k=k)
+        for row in query.all():
+            if not threshold or row.distance < threshold:
+                docs[row.position].append(chunk_doc(row))
     return docs
 
+
+def pgvector_video_query_many(query_embeddings, k=5):
+    """
+    :return: List with the pgvector_video_query output of each query, from one SQL statement
+    """
+    if not query_embeddings:
+        return []
+    video_ids = [[] for _ in query_embeddings]
+    with session_scope() as db_session:
+        apply_search_params(db_session)
+        for row in build_pgvector_many_query(db_session, Video, [Video.video_id], query_embeddings, k=k).all():
+            video_ids[row.position].append(row.video_id)
+    return video_ids
+
+
+def chroma_query_many(query_embeddings, k=3):
+    """
+    Chunk similarity search of several queries with one ChromaDB collection query.
+
+    :return: List with the search results of each query, in the pgvector_query format
+    """
+    if not query_embeddings:
+        return []
+    # Video summaries share the collection and are dropped from the results, as in VideoChatBot.vector_search
+    results = get_chroma_collection().query(query_embeddings=[list(e) for e in query_embeddings], n_results=k,
+                                            include=["metadatas"])
+    return [[{
+        'metadata': {
+            'chunk_id': metadata.get('video_chunk_id'),
+            'video_id': metadata.get('video_id'),
+            'title': metadata.get('title'),
+            'url': metadata.get('url'),
+            'start': metadata.get('start_time'),
+            'end': metadata.get('end_time'),
+            'summary': metadata.get('summary'),
+        }
+    } for metadata in metadatas if metadata.get('video_chunk_id')] for metadatas in results['metadatas']]
+
 def get_db_url():
-    return database_url
\ No newline at end of file
+    return database_url or os.getenv("DATABASE_URL")
\ No newline at end of file
@@ -0,0 +1,233 @@
+import argparse
+import logging
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+if __name__ == "__main__":
+    # Settings are read when their module is imported, so .env is loaded before the imports below
+    load_dotenv()
+
+from sqlalchemy import text
+
+from . import database
+from .database import (EMBEDDING_DIMENSION, Base, Video, VideoChunk, apply_search_params, build_pgvector_query,
+                       session_scope)
+from .keyword_index import KeywordIndex
+from .metrics import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Tables holding an embedding column, each gets its own ANN index
+VECTOR_TABLES = (Video.__tablename__, VideoChunk.__tablename__)
+# Indexed expression and operator class per quantization, matching database.quantized_embedding
+QUANTIZED_INDEXES = {
+    None: ("embedding", "vector_cosine_ops"),
+    "halfvec": (f"(embedding::halfvec({EMBEDDING_DIMENSION}))", "halfvec_cosine_ops"),
+    "bit": (f"(binary_quantize(embedding)::bit({EMBEDDING_DIMENSION}))", "bit_hamming_ops"),
+}
+
+
+def _index_name(table, method, quantization=None):
+    if quantization:
+        return f"{table}_embedding_{quantization}_{method}_idx"
+    return f"{table}_embedding_{method}_idx"
+
+
+def _execute(statements):
+    try:
+        with session_scope() as db_session:
+            for statement in statements:
+                logger.info(statement)
+                db_session.execute(text(statement))
+    except Exception as e:
+        logger.error("Database error: %s", e)
+        raise e
+
+
+def create_schema():
+    """Create the vector extension and the videos/video_chunks tables if missing."""
+    _execute(["CREATE EXTENSION IF NOT EXISTS vector"])
+    Base.metadata.create_all(database.get_engine())
+
+
+def default_ivfflat_lists(table):
+    # pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) above
+    with session_scope() as db_session:
+        rows = db_session.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+    return max(10, rows // 1000 if rows <= 1_000_000 else int(rows ** 0.5))
+
+
+def create_vector_indexes(method="hnsw", m=16, ef_construction=64, lists=None, quantization=None):
+    """
+    Create cosine ANN indexes on videos.embedding and video_chunks.embedding.
+
+    :param method: "hnsw" or "ivfflat"
+    :param m: HNSW max connections per layer
+    :param ef_construction: HNSW candidate list size while building
+    :param lists: IVFFlat list count, derived from the row count when None
+    :param quantization: "halfvec" or "bit" to index the quantized embeddings searched with
+        PGVECTOR_QUANTIZATION (half or 1/32 of the index size); existing rows are indexed too
+    """
+    if quantization not in QUANTIZED_INDEXES:
+        raise ValueError(f"Unsupported quantization: {quantization}")
+    expression, operator_class = QUANTIZED_INDEXES[quantization]
+    statements = []
+    for table in VECTOR_TABLES:
+        if method == "hnsw":
+            options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+        elif method == "ivfflat":
+            # IVFFlat centroids are trained on existing rows, build it after loading data
+            options = f"lists = {int(lists or default_ivfflat_lists(table))}"
+        else:
+            raise ValueError(f"Unsupported index method: {method}")
+        statements.append(
+            f"CREATE INDEX IF NOT EXISTS {_index_name(table, method, quantization)} ON {table} "
+            f"USING {method} ({expression} {operator_class}) WITH ({options})"
+        )
+        statements.append(f"ANALYZE {table}")
+    _execute(statements)
+
+
+def drop_vector_indexes(method="hnsw", quantization=None):
+    _execute([f"DROP INDEX IF EXISTS {_index_name(table, method, quantization)}" for table in VECTOR_TABLES])
+
+
+def quantize_embeddings(quantization="halfvec", method="hnsw"):
+    """
+    Migrate the stored embeddings of the DB_TYPE backend to quantized first-pass search.
+
+    pgvector: build the `quantization` expression index over the existing rows; set
+    PGVECTOR_QUANTIZATION to the same value to query it. numpy: write the int8 codes of
+    the existing rows; set NUMPY_QUANTIZATION=int8 to search them.
+    """
+    if database.DB_TYPE == "numpy":
+        from .numpy_store import get_numpy_store
+        store = get_numpy_store()
+        quantized = store.quantize()
+        print(f"Quantized {quantized} rows to int8 in {store.directory}")
+    else:
+        create_vector_indexes(method, quantization=quantization)
+
+
+def build_keyword_index(batch_size=1000):
+    """
+    Index the chunk summaries already stored in video_chunks into the BM25 keyword index.
+    Raw transcript text is only indexed for chunks ingested after the index was enabled.
+
+    :return: Number of chunks indexed
+    """
+    index = KeywordIndex()
+    indexed = 0
+    with session_scope() as db_session:
+        batch = []
+        for chunk in db_session.query(VideoChunk).yield_per(batch_size):
+            batch.append({
+                'chunk_id': chunk.video_chunk_id,
+                'video_id': chunk.video_id,
+                'title': chunk.title,
+                'url': chunk.url,
+                'start_time': chunk.start_time,
+                'end_time': chunk.end_time,
+                'summary': chunk.summary,
+            })
+            if len(batch) == batch_size:
+                indexed += index.upsert(batch)
+                batch = []
+        indexed += index.upsert(batch)
+    print(f"Indexed {indexed} chunks into {index.path}")
+    return indexed
+
+
+def explain_query(query_embedding, video_id=None, k=3, runs=20):
+    """
+    Print the EXPLAIN ANALYZE plan of the chunk similarity query and its latency.
+
+    :param query_embedding: Embedding to search with
+    :param video_id: Optional video filter, as in pgvector_query
+    :param k: Number of nearest chunks
+    :param runs: Number of timed executions
+    :return: Dictionary with p50/p95/max latency in milliseconds
+    """
+    with session_scope() as db_session:
+        apply_search_params(db_session)
+        query = build_pgvector_query(db_session, query_embedding, video_id=video_id, k=k)
+        sql = str(query.statement.compile(dialect=db_session.get_bind().dialect,
+                                          compile_kwargs={"literal_binds": True}))
+        plan = db_session.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}")).scalars().all()
+        print("\n".join(plan))
+
+        latencies = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            query.all()
+            latencies.append(1000 * (time.perf_counter() - started))
+        latencies.sort()
+        report = {
+            'p50_ms': statistics.median(latencies),
+            'p95_ms': latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+            'max_ms': latencies[-1],
+        }
+        print(f"Latency over {runs} runs: " + ", ".join(f"{key}={value:.2f}" for key, value in report.items()))
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the pgvector schema and ANN indexes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("create-schema", help="create the vector extension and tables")
+
+    create = commands.add_parser("create-indexes", help="create HNSW or IVFFlat indexes on the embeddings")
+    create.add_argument("--method", choices=("hnsw", "ivfflat"), default="hnsw")
+    create.add_argument("--m", type=int, default=16, help="HNSW max connections per layer")
+    create.add_argument("--ef-construction", type=int, default=64, help="HNSW build candidate list size")
+    create.add_argument("--lists", type=int, help="IVFFlat lists (default: derived from row count)")
+    create.add_argument("--quantization", choices=("halfvec", "bit"), help="index the quantized embeddings")
+
+    drop = commands.add_parser("drop-indexes", help="drop the ANN indexes")
+    drop.add_argument("--method", choices=("hnsw", "ivfflat"), default="hnsw")
+    drop.add_argument("--quantization", choices=("halfvec", "bit"))
+
+    quantize = commands.add_parser("quantize", help="quantize the existing embeddings of DB_TYPE for first-pass "
+                                                    "search (pgvector index, or numpy int8 codes)")
+    quantize.add_argument("--quantization", choices=("halfvec", "bit"), default="halfvec",
+                          help="pgvector representation (numpy always uses int8)")
+    quantize.add_argument("--method", choices=("hnsw", "ivfflat"), default="hnsw")
+
+    commands.add_parser("build-keyword-index", help="index the stored chunk summaries for keyword (BM25) search")
+
+    explain = commands.add_parser("explain", help="show the query plan and latency of a similarity search; "
+                                                  "use PGVECTOR_EF_SEARCH/PGVECTOR_PROBES to tune recall")
+    explain.add_argument("--question", help="question to embed with OpenAI (default: random vector)")
+    explain.add_argument("--video-id")
+    explain.add_argument("-k", type=int, default=3)
+    explain.add_argument("--runs", type=int, default=20)
+
+    args = parser.parse_args()
+    configure_logging()
+    match args.command:
+        case "create-schema":
+            create_schema()
+        case "create-indexes":
+            create_vector_indexes(args.method, m=args.m, ef_construction=args.ef_construction, lists=args.lists,
+                                  quantization=args.quantization)
+        case "drop-indexes":
+            drop_vector_indexes(args.method, args.quantization)
+        case "quantize":
+            quantize_embeddings(args.quantization, args.method)
+        case "build-keyword-index":
+            build_keyword_index()
+        case "explain":
+            if args.question:
+                from langchain_openai import OpenAIEmbeddings
+                query_embedding = OpenAIEmbeddings().embed_query(args.question)
+            else:
+                import numpy as np
+                query_embedding = np.random.default_rng().standard_normal(EMBEDDING_DIMENSION).tolist()
+            explain_query(query_embedding, video_id=args.video_id, k=args.k, runs=args.runs)
+
+
+if __name__ == "__main__":
+    main()
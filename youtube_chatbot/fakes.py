@@ -0,0 +1,159 @@
+import hashlib
+import random
+import re
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Deterministic local stand-ins for the OpenAI and YouTube clients, for load tests and offline runs
+
+TRANSCRIPT_WORDS = ("data", "model", "vector", "query", "agent", "index", "prompt", "token", "chunk", "video",
+                    "embedding", "search", "latency", "cache", "python", "postgres", "summary", "stream",
+                    "[Music]", "so", "the", "and", "we", "will", "now", "look", "at", "this")
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Hashed bag-of-words embeddings: texts sharing words get similar vectors,
+    identical texts get identical vectors. `latency` seconds are spent per request.
+    """
+
+    def __init__(self, size=1536, latency=0.0):
+        self.size = size
+        self.latency = latency
+        self.model = f"fake-embedding-{size}"
+
+    def _embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in re.findall(r"[a-z0-9]+", text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.size
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering with `answer_words` words picked from the last message.
+
+    `latency` seconds are spent before the first token, and `token_latency`
+    seconds between streamed tokens.
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    answer_words: int = 30
+    model_name: str = "fake-chat-model"
+
+    @property
+    def _llm_type(self):
+        return "fake-chat-model"
+
+    def _answer(self, messages):
+        # Deterministic per prompt, so cached and uncached runs give the same text
+        words = re.findall(r"[A-Za-z0-9]+", str(messages[-1].content))
+        seed = int.from_bytes(hashlib.md5(str(messages[-1].content).encode("utf-8")).digest()[:4], "little")
+        if not words:
+            return "<<TOPIC_NOT_FOUND>>"
+        return " ".join(words[(seed + i * 7) % len(words)] for i in range(self.answer_words))
+
+    def _usage(self, messages, answer):
+        prompt_tokens = sum(len(str(message.content).split()) for message in messages)
+        completion_tokens = len(answer.split())
+        return {'input_tokens': prompt_tokens, 'output_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens}
+
+    def get_num_tokens(self, text):
+        # Word count, the default tokenizer would need transformers
+        return len(text.split())
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        answer = self._answer(messages)
+        if self.latency:
+            time.sleep(self.latency)
+        message = AIMessage(content=answer, usage_metadata=self._usage(messages, answer),
+                            response_metadata={'model_name': self.model_name})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        answer = self._answer(messages)
+        if self.latency:
+            time.sleep(self.latency)
+        words = answer.split(" ")
+        for i, word in enumerate(words):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            token = word if i == 0 else f" {word}"
+            # Usage and model name come with the last chunk, as with OpenAI's stream_usage
+            last = i == len(words) - 1
+            chunk = ChatGenerationChunk(message=AIMessageChunk(
+                content=token,
+                usage_metadata=self._usage(messages, answer) if last else None,
+                response_metadata={'model_name': self.model_name} if last else {}))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+def synthetic_transcript(minutes, seed=0):
+    """
+    :return: Transcript segments ({'text', 'start', 'duration'}) covering `minutes` of speech
+    """
+    rng = random.Random(seed)
+    transcript = []
+    start = 0.0
+    while start < minutes * 60:
+        duration = rng.uniform(1.5, 4.5)
+        text = " ".join(rng.choice(TRANSCRIPT_WORDS) for _ in range(rng.randint(4, 10)))
+        transcript.append({'text': text, 'start': round(start, 3), 'duration': round(duration, 3)})
+        start += duration * rng.uniform(0.8, 1.0)
+    return transcript
+
+
+class FakeFetchedTranscript:
+    def __init__(self, segments):
+        self.segments = segments
+
+    def to_raw_data(self):
+        return self.segments
+
+
+class FakeTranscriptApi:
+    """
+    Stand-in for YouTubeTranscriptApi serving synthetic transcripts.
+
+    `minutes_by_video` maps video ids to transcript lengths, other videos get
+    `default_minutes`. `latency` seconds are spent per fetch.
+    """
+
+    def __init__(self, minutes_by_video=None, default_minutes=10, latency=0.0):
+        self.minutes_by_video = minutes_by_video or {}
+        self.default_minutes = default_minutes
+        self.latency = latency
+
+    def fetch(self, video_id, languages=("en",)):
+        if self.latency:
+            time.sleep(self.latency)
+        minutes = self.minutes_by_video.get(video_id, self.default_minutes)
+        seed = int.from_bytes(hashlib.md5(video_id.encode("utf-8")).digest()[:4], "little")
+        return FakeFetchedTranscript(synthetic_transcript(minutes, seed=seed))
+
+
+def fake_video_details(video_id, minutes=10):
+    """
+    :return: Video details shaped like data_fetcher.get_video_details
+    """
+    return {'video_id': video_id, 'length': minutes * 60, 'title': f"Synthetic video {video_id}"}
@@ -0,0 +1,305 @@
+import logging
+import os
+import time
+
+from sqlalchemy import create_engine, Column, Float, Integer, Text, and_, func, or_, update
+from sqlalchemy.orm import sessionmaker, declarative_base
+
+# Durable ingestion queue, kept in its own database so that a local SQLite file
+# works out of the box and a shared Postgres can be used for multi-host crawls
+QueueBase = declarative_base()
+JOB_QUEUE_URL = os.getenv("JOB_QUEUE_URL", "sqlite:///ingest_queue.db")
+# Seconds a worker owns a job before another worker may take it over
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 1800))
+# Seconds between lease renewals of a worker processing a job, well below the lease
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", JOB_LEASE_SECONDS / 3))
+# Number of attempts before a job is marked as failed
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+_session_factory = None
+
+
+# IngestJob model, one row per video to process
+class IngestJob(QueueBase):
+    __tablename__ = 'ingest_jobs'
+    video_id = Column(Text, primary_key=True)
+    title = Column(Text)
+    channel_id = Column(Text)
+    status = Column(Text, default=STATUS_PENDING, index=True)
+    attempts = Column(Integer, default=0)
+    lease_owner = Column(Text)
+    lease_expires_at = Column(Float)
+    last_error = Column(Text)
+    created_at = Column(Float)
+    updated_at = Column(Float)
+
+    def to_dict(self):
+        return {
+            'video_id': self.video_id,
+            'title': self.title,
+            'channel_id': self.channel_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'lease_owner': self.lease_owner,
+            'last_error': self.last_error,
+        }
+
+
+# ChannelSyncState model, high-water mark of the last incremental sync of a channel
+class ChannelSyncState(QueueBase):
+    __tablename__ = 'channel_sync_state'
+    channel_id = Column(Text, primary_key=True)
+    last_published_at = Column(Text)  # RFC 3339 publishedAt of the newest video seen
+    etag = Column(Text)               # ETag of the first result page of the last sync
+    synced_at = Column(Float)
+
+
+def get_queue_session():
+    """
+    Return a new session on the queue database, creating the engine and the
+    tables on first use in the current process.
+    """
+    global _session_factory
+    if _session_factory is None:
+        connect_args = {"timeout": 30} if JOB_QUEUE_URL.startswith("sqlite") else {}
+        engine = create_engine(JOB_QUEUE_URL, connect_args=connect_args)
+        QueueBase.metadata.create_all(engine)
+        _session_factory = sessionmaker(bind=engine)
+    return _session_factory()
+
+
+def _claimable(now):
+    # Pending jobs and jobs whose worker lost its lease (crashed or timed out)
+    return and_(
+        or_(IngestJob.status == STATUS_PENDING,
+            and_(IngestJob.status == STATUS_RUNNING, IngestJob.lease_expires_at < now)),
+        IngestJob.attempts < JOB_MAX_ATTEMPTS
+    )
+
+
+def enqueue_videos(videos, channel_id=None):
+    """
+    Add videos to the queue, skipping the ones already queued.
+
+    :param videos: List of dicts with 'id' and 'title' (as returned by get_channel_videos)
+    :param channel_id: Optional channel the videos belong to
+    :return: Number of newly queued videos
+    """
+    session = get_queue_session()
+    try:
+        video_ids = [video['id'] for video in videos]
+        existing = {
+            row.video_id for row in
+            session.query(IngestJob.video_id).filter(IngestJob.video_id.in_(video_ids))
+        }
+        now = time.time()
+        new_jobs = []
+        for video in videos:
+            if video['id'] in existing:
+                continue
+            existing.add(video['id'])
+            new_jobs.append(IngestJob(
+                video_id=video['id'],
+                title=video.get('title'),
+                channel_id=channel_id,
+                status=STATUS_PENDING,
+                attempts=0,
+                created_at=now,
+                updated_at=now
+            ))
+        session.add_all(new_jobs)
+        session.commit()
+        logger.info("Queued %d new videos (%d already queued)", len(new_jobs), len(videos) - len(new_jobs))
+        return len(new_jobs)
+    except Exception as e:
+        session.rollback()
+        logger.error("Queue error: %s", e)
+        raise e
+    finally:
+        session.close()
+
+
+def claim_next_job(worker_id):
+    """
+    Lease the oldest claimable job to the given worker.
+
+    The lease is taken with a conditional UPDATE, so concurrent workers never
+    claim the same job; a worker losing the race simply tries the next one.
+
+    :param worker_id: Identifier of the claiming worker
+    :return: Job dict, or None when nothing is left to claim
+    """
+    session = get_queue_session()
+    try:
+        while True:
+            now = time.time()
+            # Jobs whose lease expired after their last attempt will never be claimed again
+            session.execute(
+                update(IngestJob)
+                .where(IngestJob.status == STATUS_RUNNING,
+                       IngestJob.lease_expires_at < now,
+                       IngestJob.attempts >= JOB_MAX_ATTEMPTS)
+                .values(status=STATUS_FAILED, lease_owner=None, last_error="Lease expired", updated_at=now)
+            )
+            candidate = (
+                session
+                    .query(IngestJob.video_id)
+                    .filter(_claimable(now))
+                    .order_by(IngestJob.created_at)
+                    .first()
+            )
+            if candidate is None:
+                session.commit()
+                return None
+
+            result = session.execute(
+                update(IngestJob)
+                .where(IngestJob.video_id == candidate.video_id, _claimable(now))
+                .values(status=STATUS_RUNNING,
+                        lease_owner=worker_id,
+                        lease_expires_at=now + JOB_LEASE_SECONDS,
+                        attempts=IngestJob.attempts + 1,
+                        updated_at=now)
+            )
+            session.commit()
+            if result.rowcount == 1:
+                return session.get(IngestJob, candidate.video_id).to_dict()
+    except Exception as e:
+        session.rollback()
+        logger.error("Queue error: %s", e)
+        raise e
+    finally:
+        session.close()
+
+
+def renew_lease(video_id, worker_id):
+    """
+    Extend the lease of a running job by JOB_LEASE_SECONDS, while the worker still owns it.
+
+    :return: False when the lease was lost (expired and taken over by another worker)
+    """
+    session = get_queue_session()
+    try:
+        now = time.time()
+        result = session.execute(
+            update(IngestJob)
+            .where(IngestJob.video_id == video_id,
+                   IngestJob.lease_owner == worker_id,
+                   IngestJob.status == STATUS_RUNNING)
+            .values(lease_expires_at=now + JOB_LEASE_SECONDS, updated_at=now)
+        )
+        session.commit()
+        return result.rowcount == 1
+    except Exception as e:
+        session.rollback()
+        logger.error("Queue error: %s", e)
+        raise e
+    finally:
+        session.close()
+
+
+def _finish_job(video_id, worker_id, **values):
+    session = get_queue_session()
+    try:
+        result = session.execute(
+            update(IngestJob)
+            .where(IngestJob.video_id == video_id, IngestJob.lease_owner == worker_id)
+            .values(lease_owner=None, lease_expires_at=None, updated_at=time.time(), **values)
+        )
+        session.commit()
+        if result.rowcount == 0:
+            logger.warning("Lease for %s was lost by %s, result ignored", video_id, worker_id)
+    except Exception as e:
+        session.rollback()
+        logger.error("Queue error: %s", e)
+        raise e
+    finally:
+        session.close()
+
+
+def complete_job(video_id, worker_id):
+    _finish_job(video_id, worker_id, status=STATUS_DONE, last_error=None)
+
+
+def fail_job(video_id, worker_id, error):
+    """
+    Record a failed attempt; the job goes back to pending until it runs out of attempts.
+    """
+    session = get_queue_session()
+    try:
+        job = session.get(IngestJob, video_id)
+        attempts = job.attempts if job else JOB_MAX_ATTEMPTS
+    finally:
+        session.close()
+    status = STATUS_FAILED if attempts >= JOB_MAX_ATTEMPTS else STATUS_PENDING
+    _finish_job(video_id, worker_id, status=status, last_error=str(error))
+
+
+def retry_failed_jobs():
+    """
+    Put failed jobs back in the queue with a fresh attempt budget.
+
+    :return: Number of jobs re-queued
+    """
+    session = get_queue_session()
+    try:
+        result = session.execute(
+            update(IngestJob)
+            .where(IngestJob.status == STATUS_FAILED)
+            .values(status=STATUS_PENDING, attempts=0, updated_at=time.time())
+        )
+        session.commit()
+        return result.rowcount
+    finally:
+        session.close()
+
+
+def queue_stats():
+    """
+    :return: Dictionary of job count per status
+    """
+    session = get_queue_session()
+    try:
+        rows = session.query(IngestJob.status, func.count()).group_by(IngestJob.status).all()
+        return {status: count for status, count in rows}
+    finally:
+        session.close()
+
+
+def get_channel_sync_state(channel_id):
+    """
+    :return: Dictionary with last_published_at and etag of the channel, None if never synced
+    """
+    session = get_queue_session()
+    try:
+        state = session.get(ChannelSyncState, channel_id)
+        if state is None:
+            return None
+        return {'last_published_at': state.last_published_at, 'etag': state.etag, 'synced_at': state.synced_at}
+    finally:
+        session.close()
+
+
+def save_channel_sync_state(channel_id, last_published_at, etag=None):
+    session = get_queue_session()
+    try:
+        session.merge(ChannelSyncState(
+            channel_id=channel_id,
+            last_published_at=last_published_at,
+            etag=etag,
+            synced_at=time.time()
+        ))
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error("Queue error: %s", e)
+        raise e
+    finally:
+        session.close()
@@ -0,0 +1,203 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+# Local inverted index with BM25 scoring over chunk summaries and raw chunk text
+KEYWORD_INDEX_ENABLED = os.getenv("KEYWORD_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+KEYWORD_INDEX_PATH = os.getenv("KEYWORD_INDEX_PATH", "keyword_index.db")
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Keyword matches scoring below this fraction of the question's best BM25 score are not returned; BM25
+# scores grow with the index, so the cutoff is relative. KEYWORD_MIN_SCORE adds an absolute floor (0: none)
+KEYWORD_MIN_SCORE_RATIO = float(os.getenv("KEYWORD_MIN_SCORE_RATIO", 0.25))
+KEYWORD_MIN_SCORE = float(os.getenv("KEYWORD_MIN_SCORE", 0))
+# Bumped when a migration must run on existing index files (PRAGMA user_version)
+SCHEMA_VERSION = 2
+# Constant of reciprocal rank fusion, dampens the weight of the first ranks
+RRF_K = 60
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Words found in most chunks and questions; they are neither indexed nor searched
+STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between both but
+by can could did do does doing down during each few for from further had has have having he her here hers him his
+how i if in into is it its just me more most my no nor not now of off on once only or other our ours out over own
+s same she should so some such t than that the their theirs them then there these they this those through to too
+under until up very was we were what when where which while who whom why will with would you your yours
+""".split())
+
+_default_index = None
+
+
+def tokenize(text):
+    return [term for term in TOKEN_PATTERN.findall((text or "").lower()) if term not in STOPWORDS]
+
+
+class KeywordIndex:
+    """
+    SQLite inverted index of video chunks, updated incrementally on every write.
+
+    Each chunk is indexed on its summary and raw transcript text; the postings
+    table keeps the term frequency per chunk, the terms table the document
+    frequency per term and the stats table the document count and total length
+    needed by BM25. Safe to share between threads.
+    """
+
+    def __init__(self, path=KEYWORD_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            "  doc_id TEXT PRIMARY KEY, video_id TEXT, length INTEGER, metadata TEXT);"
+            "CREATE INDEX IF NOT EXISTS docs_video_id ON docs (video_id);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "  term TEXT, doc_id TEXT, tf INTEGER, PRIMARY KEY (term, doc_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS postings_doc_id ON postings (doc_id);"
+            "CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY, doc_count INTEGER, total_length INTEGER);"
+            "INSERT OR IGNORE INTO stats VALUES (1, 0, 0);"
+        )
+        self._migrate()
+        self._connection.commit()
+
+    def _migrate(self):
+        version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+        if version < 2:
+            # Document frequencies of indexes built before the terms table, or left half-filled
+            self._connection.execute("DELETE FROM terms")
+            self._connection.execute("INSERT INTO terms SELECT term, COUNT(*) FROM postings GROUP BY term")
+        if version < SCHEMA_VERSION:
+            self._connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def upsert(self, records):
+        """
+        Index chunk records (store_to_db kwargs); video summary records are skipped.
+
+        :return: Number of chunks indexed
+        """
+        chunks = [record for record in records if record.get("chunk_id")]
+        if not chunks:
+            return 0
+        with self._lock:
+            cursor = self._connection.cursor()
+            for record in chunks:
+                doc_id = record["chunk_id"]
+                previous = cursor.execute("SELECT length FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+                if previous:
+                    cursor.execute("UPDATE terms SET df = df - 1 "
+                                   "WHERE term IN (SELECT term FROM postings WHERE doc_id = ?)", (doc_id,))
+                    cursor.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+                    cursor.execute("UPDATE stats SET doc_count = doc_count - 1, total_length = total_length - ?",
+                                   (previous[0],))
+
+                terms = Counter(tokenize(record.get("summary")) + tokenize(record.get("text")))
+                length = sum(terms.values())
+                metadata = {
+                    'chunk_id': doc_id,
+                    'video_id': record.get("video_id"),
+                    'title': record.get("title"),
+                    'url': record.get("url"),
+                    'start': record.get("start_time"),
+                    'end': record.get("end_time"),
+                    'summary': record.get("summary"),
+                }
+                cursor.execute("INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?)",
+                               (doc_id, record.get("video_id"), length, json.dumps(metadata)))
+                cursor.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                                   [(term, doc_id, tf) for term, tf in terms.items()])
+                cursor.executemany("INSERT INTO terms VALUES (?, 1) ON CONFLICT (term) DO UPDATE SET df = df + 1",
+                                   [(term,) for term in terms])
+                cursor.execute("UPDATE stats SET doc_count = doc_count + 1, total_length = total_length + ?",
+                               (length,))
+            cursor.execute("DELETE FROM terms WHERE df <= 0")
+            self._connection.commit()
+        return len(chunks)
+
+    def search(self, question, k=10, video_ids=None, min_score=KEYWORD_MIN_SCORE,
+               min_score_ratio=KEYWORD_MIN_SCORE_RATIO):
+        """
+        Rank chunks by BM25 score for the question.
+
+        :param question: Query text
+        :param k: Number of results
+        :param video_ids: Optional collection of video ids to restrict the search to
+        :param min_score: Lowest BM25 score returned
+        :param min_score_ratio: Lowest fraction of the best match's score returned
+        :return: List of (metadata, score), best first
+        """
+        terms = sorted(set(tokenize(question)))
+        if not terms:
+            return []
+        with self._lock:
+            doc_count, total_length = self._connection.execute(
+                "SELECT doc_count, total_length FROM stats").fetchone()
+            if not doc_count:
+                return []
+            average_length = total_length / doc_count
+            term_placeholders = ",".join("?" * len(terms))
+            document_frequency = dict(self._connection.execute(
+                f"SELECT term, df FROM terms WHERE term IN ({term_placeholders})", terms
+            ).fetchall())
+
+            sql = (f"SELECT p.doc_id, p.term, p.tf, d.length FROM postings p JOIN docs d ON d.doc_id = p.doc_id "
+                   f"WHERE p.term IN ({term_placeholders})")
+            params = list(terms)
+            if video_ids:
+                video_ids = list(video_ids)
+                sql += f" AND d.video_id IN ({','.join('?' * len(video_ids))})"
+                params += video_ids
+            rows = self._connection.execute(sql, params).fetchall()
+
+            scores = Counter()
+            for doc_id, term, tf, length in rows:
+                df = document_frequency[term]
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / (
+                    tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+
+            top = scores.most_common(k)
+            if top:
+                cutoff = max(min_score, top[0][1] * min_score_ratio)
+                top = [(doc_id, score) for doc_id, score in top if score >= cutoff]
+            if not top:
+                return []
+            metadata = dict(self._connection.execute(
+                f"SELECT doc_id, metadata FROM docs WHERE doc_id IN ({','.join('?' * len(top))})",
+                [doc_id for doc_id, _ in top]
+            ).fetchall())
+        return [(json.loads(metadata[doc_id]), score) for doc_id, score in top]
+
+
+def get_keyword_index():
+    """
+    :return: The process-wide KeywordIndex, or None when KEYWORD_INDEX_ENABLED is off
+    """
+    global _default_index
+    if KEYWORD_INDEX_ENABLED and _default_index is None:
+        _default_index = KeywordIndex()
+    return _default_index
+
+
+def reciprocal_rank_fusion(*rankings, k=RRF_K):
+    """
+    Fuse ranked lists of docs ({'metadata': {...}} as returned by pgvector_query)
+    by reciprocal rank fusion.
+
+    Docs are identified by their chunk id, or their url when it is missing.
+
+    :return: Fused list of docs, best first
+    """
+    scores = Counter()
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            metadata = doc['metadata']
+            key = metadata.get('chunk_id') or metadata.get('url')
+            scores[key] += 1 / (k + rank + 1)
+            docs.setdefault(key, doc)
+    return [docs[key] for key, _ in scores.most_common()]
@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process instrumentation: a duration histogram per pipeline stage and labeled
+# counters (LLM calls and tokens, embedding requests), exported as Prometheus text or JSON
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_PREFIX = "spotvid"
+# Upper bounds in seconds, from a local index lookup to a long map_reduce summary
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Level of the package logs printed by the CLI entry points (DEBUG shows transcripts, prompts and SQL)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+_token_usage_callback = None
+
+
+class Histogram:
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def cumulative_counts(self):
+        counts, total = [], 0
+        for count in self.bucket_counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of stage histograms and counters for the current process.
+
+    Stages are timed with `timed(stage)`; the number of calls of a stage is the
+    count of its histogram, and its failures are counted in `stage_errors`.
+    """
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def to_dict(self):
+        """
+        :return: {'stages': {stage: {count, sum_seconds, mean_seconds, buckets}}, 'counters': {name: [...]}}
+        """
+        with self._lock:
+            stages = {
+                stage: {
+                    'count': histogram.count,
+                    'sum_seconds': round(histogram.sum, 6),
+                    'mean_seconds': round(histogram.sum / histogram.count, 6) if histogram.count else 0.0,
+                    # Cumulative counts per upper bound, as in Prometheus
+                    'buckets': dict(zip((str(bound) for bound in histogram.buckets),
+                                        histogram.cumulative_counts())),
+                }
+                for stage, histogram in sorted(self._stages.items())
+            }
+            counters = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                counters.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        return {'stages': stages, 'counters': counters}
+
+    def to_prometheus(self, prefix=METRICS_PREFIX):
+        """
+        :return: Metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            lines = [
+                f"# HELP {prefix}_stage_duration_seconds Duration of pipeline stages",
+                f"# TYPE {prefix}_stage_duration_seconds histogram",
+            ]
+            for stage, histogram in sorted(self._stages.items()):
+                for bound, count in zip(histogram.buckets, histogram.cumulative_counts()):
+                    lines.append(f'{prefix}_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{prefix}_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{prefix}_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{prefix}_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {prefix}_{name}_total counter")
+                    typed.add(name)
+                label_text = ",".join(f'{key}="{_escape(label_value)}"' for key, label_value in labels)
+                lines.append(f"{prefix}_{name}_total{{{label_text}}} {value}" if label_text
+                             else f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def timed(stage):
+    """
+    Record the duration of the enclosed block in the stage histogram; exceptions
+    are counted in stage_errors and re-raised.
+    """
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        registry.increment("stage_errors", stage=stage)
+        raise
+    finally:
+        registry.observe(stage, time.perf_counter() - started)
+
+
+def observe(stage, seconds):
+    if METRICS_ENABLED:
+        registry.observe(stage, seconds)
+
+
+def increment(name, value=1, **labels):
+    if METRICS_ENABLED:
+        registry.increment(name, value, **labels)
+
+
+def record_llm_result(response):
+    """
+    Count the calls and token usage of a LangChain LLMResult, per model.
+    """
+    llm_output = response.llm_output or {}
+    model = llm_output.get("model_name")
+    input_tokens = output_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            model = model or (getattr(message, "response_metadata", None) or {}).get("model_name")
+            usage = getattr(message, "usage_metadata", None) or {}
+            input_tokens += usage.get("input_tokens", 0)
+            output_tokens += usage.get("output_tokens", 0)
+    if not input_tokens and not output_tokens:
+        # Completion models and older integrations only report the total of the call
+        token_usage = llm_output.get("token_usage") or {}
+        input_tokens = token_usage.get("prompt_tokens", 0)
+        output_tokens = token_usage.get("completion_tokens", 0)
+
+    model = model or "unknown"
+    increment("llm_calls", model=model)
+    increment("llm_tokens", input_tokens, model=model, type="input")
+    increment("llm_tokens", output_tokens, model=model, type="output")
+
+
+def token_usage_callback():
+    """
+    :return: Process-wide LangChain callback handler recording LLM calls and token usage,
+        to pass as config={"callbacks": [token_usage_callback()]}
+    """
+    global _token_usage_callback
+    if _token_usage_callback is None:
+        # LangChain is only imported by the modules calling an LLM
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class TokenUsageCallback(BaseCallbackHandler):
+            def on_llm_end(self, response, **kwargs):
+                record_llm_result(response)
+
+        _token_usage_callback = TokenUsageCallback()
+    return _token_usage_callback
+
+
+def export_metrics(format="prometheus"):
+    """
+    :param format: "prometheus" (text exposition format) or "json"
+    :return: Metrics of the current process as a string
+    """
+    if format == "json":
+        return json.dumps(registry.to_dict(), indent=2)
+    return registry.to_prometheus()
+
+
+def write_metrics(path):
+    """
+    Write the metrics to `path`, as JSON when it ends with .json and Prometheus text otherwise
+    (e.g. a .prom file for the node_exporter textfile collector).
+    """
+    # Written aside and renamed, so a collector never reads a half-written file
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as f:
+        f.write(export_metrics("json" if path.endswith(".json") else "prometheus"))
+    os.replace(temporary_path, path)
+
+
+def configure_logging(level=LOG_LEVEL):
+    """Send log records to stderr, for the command line entry points."""
+    logging.basicConfig(level=level.upper() if isinstance(level, str) else level,
+                        format="%(asctime)s %(levelname)s %(processName)s %(name)s: %(message)s")
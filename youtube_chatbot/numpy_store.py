@@ -0,0 +1,415 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single writer process only
+    fcntl = None
+
+from .database import EMBEDDING_DIMENSION, QUANTIZATION_RERANK_FACTOR
+
+# In-process vector store: a memory-mapped float32 matrix plus a JSONL metadata sidecar
+NUMPY_STORE_DIRECTORY = os.getenv("NUMPY_STORE_DIRECTORY", "./numpy_db")
+# "int8" searches int8 codes of the vectors first (a quarter of the float32 matrix) and re-ranks
+# the best candidates with the float32 vectors; build the codes of existing rows with `db_admin quantize`
+NUMPY_QUANTIZATION = os.getenv("NUMPY_QUANTIZATION") or None
+# Rows converted back to float32 at a time while scoring int8 codes, small enough to stay in cache
+QUANTIZED_BLOCK_ROWS = 1024
+# Queries of a search_many call scored together, bounds the (queries x rows) score matrix
+SEARCH_QUERY_BLOCK = 64
+
+_default_store = None
+
+
+class NumpyVectorStore:
+    """
+    Embedding matrix in a memory-mapped `.npy` file searched with a vectorized
+    matrix-vector product and `argpartition` top-k.
+
+    Row i of `embeddings.npy` belongs to the i-th row id recorded in
+    `metadata.jsonl`; each line holds the store_to_db kwargs of a video or
+    chunk (without the vector). Rows are L2-normalized on write, so the dot
+    product is the cosine similarity. The matrix grows by doubling and the
+    metadata file is append-only; an upsert of an existing id rewrites its
+    vector in place and appends a newer metadata line. Other processes pick
+    up new rows on their next search; writers in several processes are
+    serialized with a lock file.
+
+    With `quantization="int8"`, `embeddings_int8.npy` holds every row scaled
+    to int8 and `embeddings_scale.npy` the scale of each row. Searches score
+    the codes and re-rank the top candidates with the float32 rows, so only
+    those rows of the full matrix are read. Once the codes exist every writer
+    keeps them up to date, whatever its own quantization setting, and records
+    the number of coded rows in `embeddings_int8.rows`; searches fall back to
+    exact scoring while the codes do not cover every row.
+    """
+
+    def __init__(self, directory=NUMPY_STORE_DIRECTORY, dimension=EMBEDDING_DIMENSION,
+                 quantization=NUMPY_QUANTIZATION):
+        if quantization not in (None, "int8"):
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        self.directory = directory
+        self.dimension = dimension
+        self.quantization = quantization
+        self.matrix_path = os.path.join(directory, "embeddings.npy")
+        self.codes_path = os.path.join(directory, "embeddings_int8.npy")
+        self.scales_path = os.path.join(directory, "embeddings_scale.npy")
+        self.coded_rows_path = os.path.join(directory, "embeddings_int8.rows")
+        self.metadata_path = os.path.join(directory, "metadata.jsonl")
+        self.lock_path = os.path.join(directory, ".lock")
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._matrix = None
+        self._matrix_stat = None
+        self._codes = None
+        self._scales = None
+        self._codes_stat = None
+        self._coded_rows = 0
+        self._metadata_offset = 0
+        self.metadata = []      # row -> record metadata
+        self.row_by_id = {}     # record id -> row
+        self._filters = None    # cached (is_chunk, video_ids) arrays
+        self.refresh()
+
+    @staticmethod
+    def record_id(record):
+        chunk_id = record.get("chunk_id")
+        return f"{record['video_id']}_{chunk_id}" if chunk_id else record["video_id"]
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def _open_matrix(self):
+        stat = os.stat(self.matrix_path)
+        self._matrix = np.load(self.matrix_path, mmap_mode="r+")
+        self._matrix_stat = (stat.st_ino, stat.st_size)
+
+    def _open_codes(self):
+        stat = os.stat(self.scales_path)
+        self._codes = np.load(self.codes_path, mmap_mode="r+")
+        self._scales = np.load(self.scales_path, mmap_mode="r+")
+        self._codes_stat = (stat.st_ino, stat.st_size)
+
+    def _read_coded_rows(self):
+        try:
+            with open(self.coded_rows_path, "r", encoding="utf-8") as file:
+                return int(file.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_coded_rows(self, rows):
+        temp_path = self.coded_rows_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(str(rows))
+        os.replace(temp_path, self.coded_rows_path)
+        self._coded_rows = rows
+
+    def _codes_cover(self, count):
+        """
+        :return: True when the int8 codes match the matrix and hold the first `count` rows
+        """
+        return (self._codes is not None and self._matrix is not None
+                and self._codes.shape[0] == self._scales.shape[0] == self._matrix.shape[0]
+                and self._coded_rows >= count)
+
+    @staticmethod
+    def _quantize_rows(vectors):
+        """
+        :return: (int8 codes, float32 scales) with codes * scale ~= vectors, one scale per row
+        """
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def refresh(self):
+        """Load metadata lines and matrix growth written since the last call (also by other processes)."""
+        with self._lock:
+            if os.path.exists(self.metadata_path):
+                with open(self.metadata_path, "r", encoding="utf-8") as file:
+                    file.seek(self._metadata_offset)
+                    for line in file:
+                        if not line.endswith("\n"):
+                            break  # line still being written
+                        self._metadata_offset += len(line.encode("utf-8"))
+                        entry = json.loads(line)
+                        row = entry.pop("row")
+                        if row == len(self.metadata):
+                            self.metadata.append(entry)
+                        else:
+                            self.metadata[row] = entry
+                        self.row_by_id[self.record_id(entry)] = row
+                        self._filters = None
+            if os.path.exists(self.matrix_path):
+                stat = os.stat(self.matrix_path)
+                if self._matrix is None or self._matrix_stat != (stat.st_ino, stat.st_size):
+                    self._open_matrix()
+            # The scales file is replaced last when the codes grow, or created by quantize()
+            if os.path.exists(self.scales_path):
+                stat = os.stat(self.scales_path)
+                if self._codes is None or self._codes_stat != (stat.st_ino, stat.st_size):
+                    self._open_codes()
+                self._coded_rows = self._read_coded_rows()
+
+    @contextmanager
+    def _write_lock(self):
+        with open(self.lock_path, "w") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _grow(path, current, shape, dtype):
+        """Copy `current` (or nothing) into a new file of `shape` and replace `path` with it."""
+        temp_path = path + ".tmp"
+        grown = np.lib.format.open_memmap(temp_path, mode="w+", dtype=dtype, shape=shape)
+        if current is not None:
+            grown[:current.shape[0]] = current
+        grown.flush()
+        del grown
+        os.replace(temp_path, path)
+
+    def _ensure_capacity(self, rows):
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(rows, 2 * capacity, 1024)
+        if self._codes is not None:
+            self._grow(self.codes_path, self._codes, (new_capacity, self.dimension), np.int8)
+            self._grow(self.scales_path, self._scales, (new_capacity,), np.float32)
+            self._open_codes()
+        self._grow(self.matrix_path, self._matrix, (new_capacity, self.dimension), np.float32)
+        self._open_matrix()
+
+    def quantize(self, block_rows=QUANTIZED_BLOCK_ROWS):
+        """
+        Build the int8 codes of every stored row, for stores written without quantization.
+
+        :return: Number of rows quantized
+        """
+        with self._lock, self._write_lock():
+            self.refresh()
+            return self._build_codes(block_rows)
+
+    def _build_codes(self, block_rows=QUANTIZED_BLOCK_ROWS):
+        if self._matrix is None:
+            return 0
+        capacity = self._matrix.shape[0]
+        self._grow(self.codes_path, None, (capacity, self.dimension), np.int8)
+        codes = np.load(self.codes_path, mmap_mode="r+")
+        scales = np.zeros(capacity, dtype=np.float32)
+        for start in range(0, len(self.metadata), block_rows):
+            end = min(start + block_rows, len(self.metadata))
+            codes[start:end], scales[start:end] = self._quantize_rows(self._matrix[start:end])
+        codes.flush()
+        del codes
+        # Readers pick up the codes once the scales file appears
+        temp_path = self.scales_path + ".tmp"
+        with open(temp_path, "wb") as file:
+            np.save(file, scales)
+        os.replace(temp_path, self.scales_path)
+        self._open_codes()
+        self._write_coded_rows(len(self.metadata))
+        return len(self.metadata)
+
+    def upsert(self, records):
+        """
+        Write records (store_to_db kwargs with 'embedding_vector') to the store.
+
+        :return: Number of records written
+        """
+        with self._lock, self._write_lock():
+            self.refresh()
+            lines = []
+            rows = []
+            next_row = len(self.metadata)
+            new_rows = {}
+            for record in records:
+                record_id = self.record_id(record)
+                row = self.row_by_id.get(record_id, new_rows.get(record_id))
+                if row is None:
+                    row = new_rows[record_id] = next_row
+                    next_row += 1
+                rows.append(row)
+                # Raw chunk text stays out of the sidecar, which is read fully into memory
+                entry = {key: value for key, value in record.items() if key not in ("embedding_vector", "text")}
+                lines.append(json.dumps({"row": row, **entry}, separators=(",", ":")) + "\n")
+
+            if not rows:
+                return 0
+            self._ensure_capacity(next_row)
+            if (self._codes is None and self.quantization) or (
+                    self._codes is not None and not self._codes_cover(len(self.metadata))):
+                # Also covers the rows written before quantization was turned on, or by a writer
+                # that did not maintain the codes
+                self._build_codes()
+            vectors = np.asarray([record["embedding_vector"] for record in records], dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1, norms)
+            self._matrix[rows] = vectors
+            self._matrix.flush()
+            if self._codes is not None:
+                self._codes[rows], self._scales[rows] = self._quantize_rows(vectors)
+                self._codes.flush()
+                self._scales.flush()
+                self._write_coded_rows(max(self._coded_rows, next_row))
+            # Vectors are on disk before the metadata lines that make the rows visible
+            with open(self.metadata_path, "a", encoding="utf-8") as file:
+                file.writelines(lines)
+            self.refresh()
+            return len(rows)
+
+    def get(self, video_id, chunk_id=None):
+        with self._lock:
+            self.refresh()
+            row = self.row_by_id.get(self.record_id({"video_id": video_id, "chunk_id": chunk_id}))
+            return None if row is None else self.metadata[row]
+
+    def _get_filters(self):
+        if self._filters is None:
+            is_chunk = np.fromiter((bool(entry.get("chunk_id")) for entry in self.metadata),
+                                   dtype=bool, count=len(self.metadata))
+            video_ids = np.array([entry["video_id"] for entry in self.metadata], dtype=object)
+            self._filters = (is_chunk, video_ids)
+        return self._filters
+
+    def search(self, query_embedding, k=3, video_ids=None, chunks=True):
+        """
+        Find the k rows most similar to the query.
+
+        :param query_embedding: Query vector
+        :param k: Number of results
+        :param video_ids: Optional collection of video ids to restrict the search to
+        :param chunks: Search chunk rows when True, video summary rows when False
+        :return: List of (metadata, cosine distance) sorted by distance
+        """
+        return self.search_many([query_embedding], k=k, video_ids=None if video_ids is None else [video_ids],
+                                chunks=chunks)[0]
+
+    def search_many(self, query_embeddings, k=3, video_ids=None, chunks=True):
+        """
+        Find the k rows most similar to each query, scoring all queries with one matrix product.
+
+        :param query_embeddings: Query vectors
+        :param video_ids: Optional list with a collection of video ids (or None) per query
+        :return: List with the search result of each query, as returned by search()
+        """
+        with self._lock:
+            self.refresh()
+            count = len(self.metadata)
+            if count == 0 or not len(query_embeddings):
+                return [[] for _ in query_embeddings]
+            queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            queries = queries / np.where(norms == 0, 1, norms)
+
+            # Codes missing rows (left behind by an older writer) are not searched until rebuilt
+            quantized = self.quantization and self._codes_cover(count)
+            is_chunk, row_video_ids = self._get_filters()
+            results = []
+            for i, query in enumerate(queries):
+                if i % SEARCH_QUERY_BLOCK == 0:
+                    # (queries, rows) scores of the next block of queries: first pass on the int8 codes, or exact
+                    block = queries[i:i + SEARCH_QUERY_BLOCK]
+                    block_scores = (self._approximate_scores(block, count) if quantized
+                                    else block @ self._matrix[:count].T)
+                mask = is_chunk if chunks else ~is_chunk
+                if video_ids is not None and video_ids[i] is not None:
+                    mask = mask & np.isin(row_video_ids, list(video_ids[i]))
+                matching = int(mask.sum())
+                query_k = min(k, matching)
+                if query_k <= 0:
+                    results.append([])
+                    continue
+                scores = np.where(mask, block_scores[i % SEARCH_QUERY_BLOCK], -np.inf)
+
+                if quantized:
+                    # Exact scores for the candidates only
+                    candidates = min(query_k * QUANTIZATION_RERANK_FACTOR, matching)
+                    rows = np.sort(np.argpartition(-scores, candidates - 1)[:candidates])
+                    exact = self._matrix[rows] @ query
+                    top = np.argsort(-exact)[:query_k]
+                    results.append([(self.metadata[rows[j]], 1.0 - float(exact[j])) for j in top])
+                    continue
+
+                top = np.argpartition(-scores, query_k - 1)[:query_k]
+                top = top[np.argsort(-scores[top])]
+                results.append([(self.metadata[row], 1.0 - float(scores[row])) for row in top])
+            return results
+
+    def _approximate_scores(self, queries, count, block_rows=QUANTIZED_BLOCK_ROWS):
+        scores = np.empty((len(queries), count), dtype=np.float32)
+        for start in range(0, count, block_rows):
+            end = min(start + block_rows, count)
+            block = self._codes[start:end].astype(np.float32)
+            scores[:, start:end] = (queries @ block.T) * self._scales[start:end]
+        return scores
+
+
+def get_numpy_store():
+    """
+    :return: The process-wide NumpyVectorStore, opened on first use
+    """
+    global _default_store
+    if _default_store is None:
+        _default_store = NumpyVectorStore()
+    return _default_store
+
+
+def chunk_doc(metadata):
+    return {
+        'metadata': {
+            'chunk_id': metadata['chunk_id'],
+            'video_id': metadata['video_id'],
+            'title': metadata['title'],
+            'url': metadata['url'],
+            'start': metadata['start_time'],
+            'end': metadata['end_time'],
+            'summary': metadata['summary'],
+        }
+    }
+
+
+def numpy_query(query_embedding, video_id=None, threshold=.5, k=3):
+    """
+    Chunk similarity search on the NumPy store, same output format as pgvector_query.
+    video_id may be a single id or a list of ids.
+    """
+    return numpy_query_many([query_embedding], video_ids=[video_id], threshold=threshold, k=k)[0]
+
+
+def numpy_query_many(query_embeddings, video_ids=None, threshold=.5, k=3):
+    """
+    Chunk similarity search of several queries with one matrix product.
+
+    :param video_ids: Optional list with a video id, a list of ids or None per query
+    :return: List with the numpy_query output of each query
+    """
+    if video_ids is not None:
+        video_ids = [[video_id] if isinstance(video_id, str) else (video_id or None) for video_id in video_ids]
+    results = get_numpy_store().search_many(query_embeddings, k=k, video_ids=video_ids)
+    return [[chunk_doc(metadata) for metadata, distance in query_results if not threshold or distance < threshold]
+            for query_results in results]
+
+
+def numpy_video_query(query_embedding, k=5):
+    """
+    :return: Ids of the k videos whose summary embedding is closest to the query
+    """
+    return numpy_video_query_many([query_embedding], k=k)[0]
+
+
+def numpy_video_query_many(query_embeddings, k=5):
+    """
+    :return: List with the numpy_video_query output of each query
+    """
+    return [[metadata['video_id'] for metadata, _ in results]
+            for results in get_numpy_store().search_many(query_embeddings, k=k, chunks=False)]
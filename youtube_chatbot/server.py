@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+if __name__ == "__main__":
+    # Settings are read when their module is imported, so .env is loaded before the imports below
+    load_dotenv()
+
+from aiohttp import web
+
+from .chatbot import VideoChatBot
+from .metrics import configure_logging, export_metrics
+
+# Number of queries executed at the same time (embedding, search and LLM calls run on a thread pool)
+SERVICE_MAX_CONCURRENCY = int(os.getenv("SERVICE_MAX_CONCURRENCY", 16))
+# Queries accepted (running or waiting) before new ones are rejected with 503
+SERVICE_MAX_PENDING = int(os.getenv("SERVICE_MAX_PENDING", 64))
+
+BOT_KEY = web.AppKey("bot", VideoChatBot)
+STATE_KEY = web.AppKey("state", dict)
+
+
+def serialize_response(response):
+    return {
+        'answer': response['answer'].content,
+        'references': response['references'],
+    }
+
+
+def _admit(request):
+    """Reserve a query slot, or return a 503 response when the service is saturated."""
+    state = request.app[STATE_KEY]
+    if state['pending'] >= state['max_pending']:
+        state['rejected'] += 1
+        return web.json_response({'error': 'Too many pending queries, retry later'}, status=503,
+                                 headers={'Retry-After': '1'})
+    state['pending'] += 1
+    return None
+
+
+def _release(request):
+    request.app[STATE_KEY]['pending'] -= 1
+
+
+async def _read_question(request):
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text='Body must be JSON: {"question": "..."}')
+    question = (body.get('question') or '').strip() if isinstance(body, dict) else ''
+    if not question:
+        raise web.HTTPBadRequest(text='Missing "question"')
+    return question
+
+
+async def handle_query(request):
+    question = await _read_question(request)
+    rejected = _admit(request)
+    if rejected:
+        return rejected
+    try:
+        state = request.app[STATE_KEY]
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(state['executor'], request.app[BOT_KEY].query, question)
+        return web.json_response(serialize_response(response))
+    finally:
+        _release(request)
+
+
+async def handle_stream_query(request):
+    """Stream the stream_query events as newline-delimited JSON."""
+    question = await _read_question(request)
+    rejected = _admit(request)
+    if rejected:
+        return rejected
+    state = request.app[STATE_KEY]
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    done = object()
+    cancelled = threading.Event()
+
+    def produce():
+        # Runs on the executor, hands every event over to the event loop until the client goes away
+        events_stream = request.app[BOT_KEY].stream_query(question)
+        try:
+            for event in events_stream:
+                if cancelled.is_set():
+                    break
+                loop.call_soon_threadsafe(events.put_nowait, event)
+        except Exception as e:
+            loop.call_soon_threadsafe(events.put_nowait, {'type': 'error', 'error': str(e)})
+        finally:
+            # Closing the generator stops the LLM stream
+            events_stream.close()
+            loop.call_soon_threadsafe(events.put_nowait, done)
+
+    try:
+        producer = loop.run_in_executor(state['executor'], produce)
+    except Exception:
+        _release(request)
+        raise
+    # The slot stays taken while the executor still runs the query, even after a disconnect
+    producer.add_done_callback(lambda _: _release(request))
+    try:
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+        while True:
+            event = await events.get()
+            if event is done:
+                break
+            if event['type'] == 'done':
+                event = {'type': 'done', **serialize_response(event),
+                         'time_to_first_token': event.get('time_to_first_token')}
+            await response.write((json.dumps(event) + "\n").encode("utf-8"))
+        await producer
+        await response.write_eof()
+        return response
+    finally:
+        cancelled.set()
+
+
+async def handle_metrics(request):
+    """Stage timings, call counts and token usage, as Prometheus text or JSON with ?format=json."""
+    if request.query.get("format") == "json":
+        return web.Response(text=export_metrics("json"), content_type="application/json")
+    return web.Response(text=export_metrics(), content_type="text/plain", headers={"X-Prometheus-Format": "0.0.4"})
+
+
+async def handle_health(request):
+    state = request.app[STATE_KEY]
+    bot = request.app[BOT_KEY]
+    return web.json_response({
+        'status': 'ok',
+        'pending': state['pending'],
+        'rejected': state['rejected'],
+        'answer_cache': bot.answer_cache.stats() if bot.answer_cache else None,
+    })
+
+
+def create_app(bot=None, max_concurrency=SERVICE_MAX_CONCURRENCY, max_pending=SERVICE_MAX_PENDING):
+    """
+    Build the query service around one warm VideoChatBot.
+
+    Endpoints:
+    - POST /query         {"question": "..."} -> {"answer": "...", "references": [...]}
+    - POST /query/stream  {"question": "..."} -> NDJSON events of VideoChatBot.stream_query
+    - GET  /health        pending/rejected counters and answer cache stats
+    - GET  /metrics       per-stage latency histograms, call counts and token usage (Prometheus, or ?format=json)
+
+    :param bot: VideoChatBot to serve, created with the default clients when None
+    :param max_concurrency: Queries executed at the same time
+    :param max_pending: Queries accepted before answering 503 (backpressure)
+    """
+    app = web.Application()
+    app[BOT_KEY] = bot or VideoChatBot()
+    app[STATE_KEY] = {
+        'executor': ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="query"),
+        'max_pending': max(max_pending, max_concurrency),
+        'pending': 0,
+        'rejected': 0,
+    }
+
+    async def shutdown_executor(app):
+        app[STATE_KEY]['executor'].shutdown(wait=False, cancel_futures=True)
+
+    app.on_cleanup.append(shutdown_executor)
+    app.router.add_post("/query", handle_query)
+    app.router.add_post("/query/stream", handle_stream_query)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve VideoChatBot queries over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-concurrency", type=int, default=SERVICE_MAX_CONCURRENCY)
+    parser.add_argument("--max-pending", type=int, default=SERVICE_MAX_PENDING)
+    parser.add_argument("--fake", action="store_true",
+                        help="use fake embeddings and LLM (no OpenAI calls), for local load tests")
+    parser.add_argument("--fake-latency", type=float, default=0.2,
+                        help="seconds of simulated LLM latency with --fake")
+    args = parser.parse_args()
+    configure_logging()
+
+    bot = None
+    if args.fake:
+        from .fakes import FakeChatModel, FakeEmbeddings
+        bot = VideoChatBot(embeddings=FakeEmbeddings(latency=0.02),
+                           llm=FakeChatModel(latency=args.fake_latency, token_latency=0.01))
+    web.run_app(create_app(bot, args.max_concurrency, args.max_pending), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,16 @@
 import json
+import logging
 import os
+from bisect import bisect_right
+from functools import lru_cache
 
-from chromadb import PersistentClient
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-from .database import Video, retrieve_from_db
+from .database import Video, retrieve_from_db, session_scope, CHROMA_PERSIST_DIRECTORY
 
+logger = logging.getLogger(__name__)
 
-def append_response_to_json(response, filename='data.json', append=False, directory='temp-folder'):
-    """
-    Appends or writes JSON response data to a file, ensuring the directory exists.
-
-    Args:
-        response (dict or list): The JSON-compatible data to store.
-        filename (str): The name of the JSON file.
-        append (bool): Whether to append data to an existing file.
-        directory (str): The directory where the file is stored.
-    """
-    # Ensure directory exists
-    os.makedirs(directory, exist_ok=True)
-
-    complete_path = os.path.join(directory, filename)
-
-    try:
-        if append and os.path.exists(complete_path):
-            try:
-                with open(complete_path, 'r', encoding='utf-8') as file:
-                    existing_data = json.load(file)
-                    if not isinstance(existing_data, list):
-                        existing_data = [existing_data]  # Ensure it's a list
-            except json.JSONDecodeError:
-                existing_data = []
-
-            existing_data.append(response)  # Append new data
-        else:
-            existing_data = response  # Overwrite with new data
-
-        # Write updated data back to file
-        with open(complete_path, 'w', encoding='utf-8') as file:
-            json.dump(existing_data, file, indent=4)
-
-        print(f"Data successfully written to {complete_path}")
-
-    except Exception as e:
-        print(f"Error handling JSON file: {e}")
+# tiktoken encoding token budgets are counted in (gpt-3.5-turbo and the embedding models)
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "cl100k_base")
 
 
 def read_json_file(file_path):
@@ -67,11 +34,11 @@ def read_json_file(file_path):
         return find_json_error(content)
 
     except FileNotFoundError:
-        print(f"Error: File '{file_path}' not found")
+        logger.error("File '%s' not found", file_path)
         raise
 
     except Exception as e:
-        print(f"Error: An unexpected error occurred: {str(e)}")
+        logger.error("An unexpected error occurred: %s", e)
         raise
 
 
@@ -85,13 +52,9 @@ def find_json_error(json_str):
         # Get the line where error occurred
         lines = json_str.split('\n')
         line_no = e.lineno - 1  # JSON decoder line numbers are 1-based
-        print(f"Error on line {e.lineno}: {lines[line_no]}")
-        print(f"Position in line: {e.colno}")
-        print(f"Error message: {e.msg}")
-
         # Show the problematic line with a pointer
-        print(lines[line_no])
-        print(" " * (e.colno - 1) + "^")
+        logger.error("Error on line %d, position %d: %s\n%s\n%s", e.lineno, e.colno, e.msg,
+                     lines[line_no], " " * (e.colno - 1) + "^")
 
 
 def fix_json_quotes(json_str):
@@ -103,17 +66,15 @@ def fix_json_quotes(json_str):
 
 
 def read_complete_table():
-    con = Session()
-    try:
-        videos =con.query(Video).all()
+    with session_scope() as db_session:
+        videos = db_session.query(Video).all()
         for video in videos:
             video.print_details()  # Call the print_details method for each video
-    finally:
-        con.close()
 
 def read_chroma_db():
     # Connect to the database
-    client = PersistentClient(path="./chroma_db")
+    from chromadb import PersistentClient
+    client = PersistentClient(path=CHROMA_PERSIST_DIRECTORY)
 
     # List all collections
     collections = client.list_collections()
@@ -125,45 +86,143 @@ def read_chroma_db():
 
 def merge_transcript_text(transcript):
     """Merge transcript into a single text block while preserving metadata mapping."""
-    merged_text = ""
+    parts = []
     segment_map = []
+    offset = 0
 
     for segment in transcript:
-        start_idx = len(merged_text)
-        merged_text += segment["text"] + " "
-        end_idx = len(merged_text)
+        text = segment["text"]
+        # Each segment owns its text plus the separating space
+        end_idx = offset + len(text) + 1
         segment_map.append(
-            {"start": segment["start"], "duration": segment["duration"], "start_idx": start_idx, "end_idx": end_idx})
+            {"start": segment["start"], "duration": segment["duration"], "start_idx": offset, "end_idx": end_idx})
+        parts.append(text)
+        offset = end_idx
+
+    return " ".join(parts), segment_map
 
-    return merged_text.strip(), segment_map
 
+@lru_cache(maxsize=None)
+def token_counter(encoding_name=TOKEN_ENCODING):
+    """
+    :param encoding_name: tiktoken encoding of the model reading the chunks
+    :return: Function returning the number of tokens of a text
+    """
+    import tiktoken
+    encoding = tiktoken.get_encoding(encoding_name)
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
 
-def split_text_with_metadata(text, segment_map, chunk_size=1000, overlap=50):
-    """Use LangChain's text splitter while mapping to original timestamps."""
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap)
-    chunks = text_splitter.split_text(text)
 
-    split_segments = []
-    for chunk in chunks:
-        start_idx = text.find(chunk)
-        start_time, duration = None, 0
+def pause_sections(segment_map, pause_seconds, text_length):
+    """
+    Split the merged transcript where the speaker pauses.
 
-        for segment in segment_map:
-            if segment["start_idx"] <= start_idx < segment["end_idx"]:
-                start_time = segment["start"]
-                break
+    :param segment_map: Segment offsets from merge_transcript_text
+    :param pause_seconds: Minimum silence between the end of a segment and the start of the next one
+    :param text_length: Length of the merged text
+    :return: List of (start_idx, end_idx) character ranges; a single range when pause_seconds is falsy
+    """
+    bounds = [0]
+    if pause_seconds:
+        for previous, segment in zip(segment_map, segment_map[1:]):
+            if segment["start"] - (previous["start"] + previous["duration"]) >= pause_seconds:
+                bounds.append(segment["start_idx"])
+    bounds.append(text_length)
+    return list(zip(bounds, bounds[1:]))
 
-        if start_time is None:
-            start_time = segment_map[0]["start"]
 
-        for segment in segment_map:
-            if segment["start_idx"] <= start_idx + len(chunk) <= segment["end_idx"]:
-                duration += segment["duration"]
+def shared_overlap(previous, chunk, overlap, length_function=len):
+    """
+    Length of the overlap the text splitter repeated from `previous` at the start of `chunk`.
 
-        split_segments.append({"text": chunk, "start": start_time, "duration": duration})
+    :param overlap: Maximum overlap, measured with `length_function`
+    :return: Number of characters of the longest suffix of `previous` that starts `chunk`
+        and fits `overlap`, 0 when they share nothing
+    """
+    shared = 0
+    # A chunk can be made of the overlap alone, so the suffix may be as long as the chunk
+    for size in range(1, min(len(previous), len(chunk)) + 1):
+        if not chunk.startswith(previous[-size:]):
+            continue
+        # Longer suffixes only add tokens, stop at the first one over the overlap
+        if length_function(previous[-size:]) > overlap:
+            break
+        shared = size
+    return shared
+
+
+def split_text_with_metadata(text, segment_map, chunk_size=1000, overlap=50, length_function=len, pause_seconds=0):
+    """
+    Use LangChain's text splitter while mapping to original timestamps.
+
+    With `pause_seconds`, chunks end where the speaker pauses: the sections between
+    pauses are packed into chunks of up to `chunk_size`, and only sections longer
+    than that are split (with `overlap`) inside.
+
+    :param chunk_size: Maximum chunk length, measured with `length_function`
+    :param overlap: Length repeated between consecutive chunks of a split section
+    :param length_function: len for characters, or token_counter(...) for tokens
+    :param pause_seconds: Minimum silence to end a chunk at, 0 to ignore pauses
+    :return: List of {'text', 'start', 'duration'} chunks
+    """
+    if not segment_map:
+        return []
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap,
+                                                   length_function=length_function)
+    pieces = []  # (start_idx, chunk) in text order
+    pending_start = pending_end = None
+    pending_length = 0
+
+    def flush():
+        if pending_start is not None:
+            chunk = text[pending_start:pending_end].strip()
+            if chunk:
+                start_idx = text.find(chunk, pending_start)
+                pieces.append((start_idx if start_idx >= 0 else pending_start, chunk))
+
+    for section_start, section_end in pause_sections(segment_map, pause_seconds, len(text)):
+        length = length_function(text[section_start:section_end])
+        if pending_start is not None and pending_length + length > chunk_size:
+            flush()
+            pending_start, pending_length = None, 0
+        if length <= chunk_size:
+            if pending_start is None:
+                pending_start = section_start
+            pending_end = section_end
+            pending_length += length
+            continue
+
+        # Locate each chunk where the previous one ends, less the overlap they share; the
+        # splitter's own start_index assumes the overlap is counted in characters
+        previous, search_from = "", section_start
+        for chunk in text_splitter.split_text(text[section_start:section_end]):
+            start_idx = text.find(chunk, search_from - shared_overlap(previous, chunk, overlap, length_function))
+            if start_idx < 0:
+                # The splitter rejoined the chunk with other whitespace, keep it after the previous one
+                start_idx = min(search_from, section_end - 1)
+            pieces.append((start_idx, chunk))
+            previous, search_from = chunk, start_idx + len(chunk)
+    flush()
+
+    segment_starts = [segment["start_idx"] for segment in segment_map]
+    split_segments = []
+    for start_idx, chunk in pieces:
+        end_idx = start_idx + len(chunk)
+
+        # Segments containing the first and the last character of the chunk
+        first = max(bisect_right(segment_starts, start_idx) - 1, 0)
+        last = max(bisect_right(segment_starts, end_idx - 1) - 1, first)
+        start_time = segment_map[first]["start"]
+        end_time = segment_map[last]["start"] + segment_map[last]["duration"]
+
+        split_segments.append({"text": chunk, "start": start_time, "duration": end_time - start_time})
 
     return split_segments
 
+
 def get_video_by_id_from_db(video_id) -> Video:
     """
      Retrieve a video from the database by its ID.
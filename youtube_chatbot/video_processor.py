@@ -1,74 +1,209 @@
+import logging
+import os
+
 import numpy as np
-from langchain.chains.summarize import load_summarize_chain
 from langchain_core.documents import Document
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from langchain_openai import OpenAIEmbeddings
-from youtube_transcript_api import YouTubeTranscriptApi
 
-from .config_templates import CHUNK_SUMMARY_TEMPLATE
+from .artifact_store import fetch_artifact, record_artifact
+from .cache import CachedEmbeddings, cached_batch, get_cache, hash_text
+from .config_templates import CHUNK_SUMMARY_TEMPLATE, VIDEO_SUMMARY_TEMPLATE
 from .data_fetcher import get_video_details
-from .database import store_to_db, retrieve_from_db
-from .utility import append_response_to_json, merge_transcript_text, split_text_with_metadata
+from .database import store_many_to_db, retrieve_from_db
+from .metrics import increment, timed, token_usage_callback
+from .utility import TOKEN_ENCODING, merge_transcript_text, split_text_with_metadata, token_counter
+
+# Token budget of a transcript chunk sent to the chunk summary prompt, and the tokens repeated between chunks
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", 400))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 40))
+# End chunks at silences of at least this many seconds between transcript segments (0 disables)
+CHUNK_PAUSE_SECONDS = float(os.getenv("CHUNK_PAUSE_SECONDS", 0))
+# Number of texts sent to the embedding endpoint per request
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 100))
+# Maximum number of chunk summarization requests in flight at once
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", 8))
+# "hierarchical" builds the video summary from the chunk summaries, "map_reduce"
+# runs LangChain's map_reduce chain over the whole transcript (one more LLM pass)
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "hierarchical")
+# Token budget of the chunk summaries combined in one reduce call; longer videos are reduced in a tree
+SUMMARY_REDUCE_MAX_TOKENS = int(os.getenv("SUMMARY_REDUCE_MAX_TOKENS", 3000))
+
+logger = logging.getLogger(__name__)
+
+
+def embed_texts(embeddings, texts, batch_size=EMBEDDING_BATCH_SIZE):
+    """
+    Embed a list of texts through `embed_documents` in batches.
+
+    :param embeddings: LangChain embeddings client
+    :param texts: Texts to embed, order is preserved in the result
+    :param batch_size: Number of texts sent per embedding request
+    :return: List of embedding vectors (lists of floats), one per text
+    """
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        vectors.extend(np.array(embeddings.embed_documents(batch)).tolist())
+    return vectors
+
+
+def summarize_chunks(chunked_transcript, max_concurrency=SUMMARY_MAX_CONCURRENCY, cache=None):
+    """
+    Summarize transcript chunks concurrently with a single chain.
+
+    :param chunked_transcript: Chunks produced by split_text_with_metadata
+    :param max_concurrency: Maximum number of LLM requests in flight at once
+    :param cache: Optional DiskCache for summaries of unchanged chunks
+    :return: List of chunk summaries, in the same order as the chunks
+    """
+    from langchain_openai import ChatOpenAI
+    llm = ChatOpenAI()
+    prompt = ChatPromptTemplate.from_template(CHUNK_SUMMARY_TEMPLATE)
+    chain = prompt | llm | StrOutputParser()
+    namespace = f"chunk_summary:{llm.model_name}:{hash_text(CHUNK_SUMMARY_TEMPLATE)[:12]}"
+    # Runnable.batch runs on a thread pool and returns results in input order
+    return cached_batch(cache, namespace, chain, [chunk["text"] for chunk in chunked_transcript],
+                        config={"max_concurrency": max_concurrency, "callbacks": [token_usage_callback()]})
+
+
+def group_by_tokens(texts, count_tokens, max_tokens, min_size=1):
+    """
+    Split consecutive texts into groups of at most `max_tokens` tokens (a longer text gets its own group).
+
+    :param min_size: Texts a group holds before it is closed, even past `max_tokens`
+    :return: List of groups (lists of texts), in order
+    """
+    groups, group, group_tokens = [], [], 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if len(group) >= min_size and group_tokens + tokens > max_tokens:
+            groups.append(group)
+            group, group_tokens = [], 0
+        group.append(text)
+        group_tokens += tokens
+    if group:
+        groups.append(group)
+    return groups
+
+
+def reduce_summaries(summaries, llm, max_tokens=SUMMARY_REDUCE_MAX_TOKENS, count_tokens=None,
+                     max_concurrency=SUMMARY_MAX_CONCURRENCY, cache=None):
+    """
+    Combine ordered summaries into one with VIDEO_SUMMARY_TEMPLATE.
+
+    Summaries are grouped up to `max_tokens` and each group is summarized; the
+    results are grouped and summarized again until a single summary is left.
+    The groups of a level run concurrently and each is cached on its own input.
+
+    :param summaries: Chunk summaries in transcript order
+    :param llm: Chat model
+    :param max_tokens: Token budget of the summaries combined in one call
+    :param count_tokens: Token counting function, llm.get_num_tokens when None
+    :param max_concurrency: Maximum number of LLM requests in flight at once
+    :param cache: Optional DiskCache
+    :return: Video summary, "" when there are no summaries
+    """
+    if not summaries:
+        return ""
+    prompt = ChatPromptTemplate.from_template(VIDEO_SUMMARY_TEMPLATE)
+    chain = prompt | llm | StrOutputParser()
+    namespace = f"video_summary:{llm.model_name}:{hash_text(VIDEO_SUMMARY_TEMPLATE)[:12]}"
+    config = {"max_concurrency": max_concurrency, "callbacks": [token_usage_callback()]}
+    level = list(summaries)
+    while True:
+        # Groups of at least two summaries, so every level is smaller than the previous one
+        groups = group_by_tokens(level, count_tokens or llm.get_num_tokens, max_tokens,
+                                 min_size=2 if len(level) > 1 else 1)
+        level = cached_batch(cache, namespace, chain, ["\n\n".join(group) for group in groups], config=config)
+        if len(level) == 1:
+            return level[0]
+        logger.debug("Reduced %d groups of summaries, reducing again", len(level))
 
 
 def process_video(video_id):
+    # The OpenAI clients and the transcript API are only loaded once a video is processed
+    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+    from youtube_transcript_api import YouTubeTranscriptApi
+
     if retrieve_from_db(video_id):
-        print('Video is already processed')
+        logger.info("Video %s is already processed", video_id)
         return
-    details = get_video_details(video_id)
-    print(f"Processing video Id: {details['video_id']} title: {details['title']} duration: {details['length']}")
-    append_response_to_json(details, filename=f'{video_id}-video-detail-short.json')
+    with timed("video_details"):
+        details = get_video_details(video_id)
+    logger.info("Processing video Id: %s title: %s duration: %s", details['video_id'], details['title'],
+                details['length'])
 
     try:
-        transcript = YouTubeTranscriptApi().fetch(video_id=video_id).to_raw_data()
-        append_response_to_json(transcript, f'{video_id}-transcript.json')
+        with timed("transcript_fetch"):
+            # Transcripts fetched by an earlier run are read back from the artifact store
+            transcript = fetch_artifact('transcript', video_id,
+                                        lambda: YouTubeTranscriptApi().fetch(video_id=video_id).to_raw_data())
+        logger.debug("transcript: %s", transcript)
 
-        full_text = ' '.join([t['text'] for t in transcript])
-        print(f"transcript: {transcript}")
-        # Step 1: Merge transcript into a single text block
-        full_text, segment_map = merge_transcript_text(transcript)
+        with timed("transcript_split"):
+            # Step 1: Merge transcript into a single text block
+            full_text, segment_map = merge_transcript_text(transcript)
 
-        # Step 2: Split using LangChain's optimized text splitter
-        chunked_transcript = split_text_with_metadata(full_text, segment_map, chunk_size=500, overlap=50)
-        append_response_to_json(chunked_transcript, f'{video_id}-chunked_transcript.json')
+            # Step 2: Split into chunks of up to CHUNK_TOKENS tokens, at pauses when enabled
+            chunked_transcript = split_text_with_metadata(full_text, segment_map, chunk_size=CHUNK_TOKENS,
+                                                          overlap=CHUNK_OVERLAP_TOKENS,
+                                                          length_function=token_counter(TOKEN_ENCODING),
+                                                          pause_seconds=CHUNK_PAUSE_SECONDS)
+        # Re-processing an unchanged transcript with the same settings gives the same chunks, kept once
+        record_artifact('chunked_transcript', video_id, chunked_transcript, if_changed=True)
     except Exception as e:
-        print(f"Error getting transcript for {video_id}: {e}")
+        logger.error("Error getting transcript for %s: %s", video_id, e)
+        return False
+    if not chunked_transcript:
+        logger.warning("Transcript of %s is empty, skipping the video", video_id)
         return False
 
     llm = ChatOpenAI(temperature=0.1, model="gpt-3.5-turbo")  # gpt-3.5-turbo-instruct
-    embeddings = OpenAIEmbeddings()
-
-    # Step 3: Generate full video summary
-    summary_chain = load_summarize_chain(llm, chain_type="map_reduce")
-    docs = [Document(page_content=full_text)]
-    summary = summary_chain.run(docs)
-    metadata = {
-        'video_id':video_id,
+    # Summaries and embeddings of unchanged text are served from the disk cache on re-runs
+    cache = get_cache()
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(), cache)
+
+    logger.info("chunks to process: %d", len(chunked_transcript))
+    # Step 3: Summarize chunked transcript
+    with timed("chunk_summaries"):
+        chunk_summaries = summarize_chunks(chunked_transcript, cache=cache)
+    for i, (chunk, chunk_summary) in enumerate(zip(chunked_transcript, chunk_summaries)):
+        logger.debug("%d --> %s-%s summary: %s", i, chunk["start"], chunk["start"] + chunk["duration"],
+                     chunk_summary)
+
+    # Step 4: Generate full video summary
+    with timed("video_summary"):
+        if SUMMARY_MODE == "map_reduce":
+            from langchain.chains.summarize import load_summarize_chain
+            summary_chain = load_summarize_chain(llm, chain_type="map_reduce")
+            docs = [Document(page_content=full_text)]
+            callbacks = [token_usage_callback()]
+            if cache:
+                summary = cache.get_or_compute(f"video_summary:map_reduce:{llm.model_name}", full_text,
+                                               lambda: summary_chain.run(docs, callbacks=callbacks))
+            else:
+                summary = summary_chain.run(docs, callbacks=callbacks)
+        else:
+            # The chunk summaries already cover the transcript, only the reduce step is left
+            summary = reduce_summaries(chunk_summaries, llm, count_tokens=token_counter(TOKEN_ENCODING),
+                                       cache=cache)
+
+    # Step 5: Embed video summary and chunk summaries in batches
+    with timed("embedding"):
+        vectors = embed_texts(embeddings, [summary] + chunk_summaries)
+
+    records = [{
+        'video_id': video_id,
         'title': details['title'],
         'length': details['length'],
         'summary': summary,
-        'embedding_vector':np.array(embeddings.embed_query(summary)).tolist()
-    }
-    # Store video summary based on DB_TYPE
-    store_to_db(
-        **metadata
-    )
-
-    print(f'chunks to process: {len(chunked_transcript)}')
-    # Step 4: Process chunked transcript
-    # Store chunks in vector DB
-    for i, chunk in enumerate(chunked_transcript):
+        'embedding_vector': vectors[0]
+    }]
+    for i, (chunk, chunk_summary, vector) in enumerate(zip(chunked_transcript, chunk_summaries, vectors[1:])):
         start_time = chunk['start']
         end_time = start_time + chunk['duration']
-
-        prompt = ChatPromptTemplate.from_template(CHUNK_SUMMARY_TEMPLATE)
-        chain = prompt | ChatOpenAI() | StrOutputParser()
-        chunk_summary = chain.invoke(chunk["text"])
-        print(f'{i} --> {start_time}-{end_time} summary: {chunk_summary}')
-
-        metadata = {
+        records.append({
             'title': details['title'],
             'summary': chunk_summary,
             'start_time': start_time,
@@ -76,11 +211,16 @@ def process_video(video_id):
             'video_id': video_id,
             'chunk_id': f"{video_id}-{i}",
             'url': f"https://youtube.com/{video_id}?t={int(start_time)}",
-            'embedding_vector':np.array(embeddings.embed_query(chunk_summary)).tolist()
-        }
-        # Store chunks in ChromaDB or pgvector
-        store_to_db(
-            **metadata
-        )
+            # Raw transcript text, used by the keyword index
+            'text': chunk['text'],
+            'embedding_vector': vector
+        })
+
+    # Step 6: Store video summary and chunks in ChromaDB or pgvector
+    store_many_to_db(records)
+    increment("videos_processed")
+    increment("chunks_processed", len(chunked_transcript))
 
+    if cache:
+        logger.info("LLM cache: %s", cache.stats())
     return True
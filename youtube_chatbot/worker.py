@@ -0,0 +1,156 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+if __name__ == "__main__":
+    # Settings are read when their module is imported, so .env is loaded before the imports below
+    load_dotenv()
+
+from .ingest_queue import (JOB_HEARTBEAT_SECONDS, claim_next_job, complete_job, fail_job, queue_stats,
+                           renew_lease, retry_failed_jobs)
+from .metrics import configure_logging, timed, write_metrics
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def lease_heartbeat(video_id, worker_id, interval=JOB_HEARTBEAT_SECONDS):
+    """
+    Renew the lease of a job every `interval` seconds while the block runs, so that a video
+    processed for longer than JOB_LEASE_SECONDS is not reclaimed by a second worker.
+    """
+    stopped = threading.Event()
+
+    def heartbeat():
+        while not stopped.wait(interval):
+            try:
+                if not renew_lease(video_id, worker_id):
+                    logger.warning("[%s] Lease for %s was lost, another worker may process it", worker_id, video_id)
+                    return
+            except Exception as e:
+                # A transient queue error, the next beat tries again before the lease runs out
+                logger.warning("[%s] Could not renew the lease for %s: %s", worker_id, video_id, e)
+
+    thread = threading.Thread(target=heartbeat, name=f"lease-{video_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run_worker(worker_id=None, stop_when_empty=True, poll_interval=5, metrics_file=None):
+    """
+    Process queued videos until the queue is drained.
+
+    :param worker_id: Identifier used for leases (defaults to host:pid)
+    :param stop_when_empty: Return when no job is left instead of polling for new ones
+    :param poll_interval: Seconds to wait between polls when the queue is empty
+    :param metrics_file: Write the stage metrics of this worker to this path after each job (.json or Prometheus text)
+    :return: Number of jobs processed by this worker
+    """
+    # Imported here so that queue commands (--retry-failed, status) start without the processing stack
+    from .video_processor import process_video
+
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    processed = 0
+    while True:
+        job = claim_next_job(worker_id)
+        if job is None:
+            if stop_when_empty:
+                logger.info("[%s] Queue is empty, processed %d videos", worker_id, processed)
+                if metrics_file:
+                    write_metrics(metrics_file)
+                return processed
+            time.sleep(poll_interval)
+            continue
+
+        video_id = job['video_id']
+        logger.info("[%s] Processing video %s (attempt %d): %s", worker_id, video_id, job['attempts'], job['title'])
+        try:
+            with lease_heartbeat(video_id, worker_id), timed("process_video"):
+                result = process_video(video_id)
+            if result is False:
+                fail_job(video_id, worker_id, "Transcript could not be fetched")
+            else:
+                complete_job(video_id, worker_id)
+        except Exception as e:
+            logger.exception("[%s] Error processing video %s: %s", worker_id, video_id, e)
+            fail_job(video_id, worker_id, e)
+        processed += 1
+        # Flushed per job, so a killed worker keeps the metrics of what it processed
+        if metrics_file:
+            write_metrics(metrics_file)
+
+
+def run_workers(num_workers, stop_when_empty=True, poll_interval=5, metrics_dir=None):
+    """
+    Run worker processes against the queue and wait for them to exit.
+
+    :param num_workers: Number of worker processes
+    :param stop_when_empty: Let workers exit once the queue is drained
+    :param poll_interval: Seconds between polls when the queue is empty
+    :param metrics_dir: Directory receiving one Prometheus metrics file per worker (worker-<n>.prom)
+    """
+    def metrics_file(n):
+        return os.path.join(metrics_dir, f"worker-{n}.prom") if metrics_dir else None
+
+    if num_workers <= 1:
+        run_worker(stop_when_empty=stop_when_empty, poll_interval=poll_interval, metrics_file=metrics_file(0))
+        return
+
+    # Spawn so that no DB connection is shared with the parent process
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_spawned_worker,
+                        kwargs={'stop_when_empty': stop_when_empty, 'poll_interval': poll_interval,
+                                'metrics_file': metrics_file(n)})
+        for n in range(num_workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+def _spawned_worker(**kwargs):
+    # Spawned processes start without the parent's logging configuration
+    configure_logging()
+    run_worker(**kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued YouTube videos.")
+    parser.add_argument("-n", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes")
+    parser.add_argument("--follow", action="store_true",
+                        help="keep polling for new jobs instead of exiting when the queue is empty")
+    parser.add_argument("--poll-interval", type=float, default=5,
+                        help="seconds between polls when the queue is empty")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="re-queue failed jobs before starting")
+    parser.add_argument("--metrics-dir",
+                        help="write per-stage timings, call counts and token usage of each worker to this directory")
+    args = parser.parse_args()
+    configure_logging()
+
+    if args.retry_failed:
+        print(f"Re-queued {retry_failed_jobs()} failed jobs")
+    print(f"Queue status: {queue_stats()}")
+    if args.metrics_dir:
+        os.makedirs(args.metrics_dir, exist_ok=True)
+    run_workers(args.workers, stop_when_empty=not args.follow, poll_interval=args.poll_interval,
+                metrics_dir=args.metrics_dir)
+    print(f"Queue status: {queue_stats()}")
+
+
+if __name__ == "__main__":
+    main()